@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the table JSON export row conversion
+Compares the old per-value isinstance checks with the per-column converter plan
+on a synthetic table (no database needed)
+
+Usage: python benchmark_json_export.py [rows]
+"""
+
+import sys
+import json
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from table_export import build_column_converters
+
+
+# Synthetic table: (column name, type OID) as reported by cursor.description
+DESCRIPTION = [
+    ('id', 20),             # int8
+    ('user_id', 2950),      # uuid
+    ('title', 25),          # text
+    ('amount', 1700),       # numeric
+    ('is_active', 16),      # bool
+    ('payload', 3802),      # jsonb
+    ('tags', 1009),         # text[]
+    ('created_at', 1184),   # timestamptz
+    ('updated_at', 1184),   # timestamptz
+    ('avatar', 17),         # bytea
+]
+
+
+def make_rows(count: int):
+    """Generate rows shaped like psycopg2 output for DESCRIPTION"""
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    user = uuid.uuid4()
+    avatar = memoryview(b'\x89PNG\r\n')
+    return [
+        (
+            i,
+            user,
+            f"Document {i}",
+            Decimal(i) / 100,
+            i % 2 == 0,
+            {'page': i % 50, 'source': 'upload'},
+            ['pdf', 'policy'],
+            base + timedelta(seconds=i),
+            base + timedelta(seconds=i, minutes=5),
+            avatar,
+        )
+        for i in range(count)
+    ]
+
+
+def convert_legacy(rows, columns):
+    """Previous implementation: isinstance checks on every value of every row"""
+    for row in rows:
+        item = dict(zip(columns, row))
+        for key, value in item.items():
+            if isinstance(value, (datetime,)):
+                item[key] = value.isoformat()
+            elif not isinstance(value, (str, int, float, bool, type(None), list, dict)):
+                item[key] = str(value)
+        yield item
+
+
+def convert_planned(rows, columns):
+    """Current implementation: converter plan built once from the type OIDs"""
+    converters = [
+        (index, convert)
+        for index, convert in enumerate(build_column_converters(DESCRIPTION))
+        if convert is not None
+    ]
+    for row in rows:
+        row = list(row)
+        for index, convert in converters:
+            value = row[index]
+            if value is not None:
+                row[index] = convert(value)
+        yield dict(zip(columns, row))
+
+
+def run(name, convert, rows, columns, encode):
+    start = time.perf_counter()
+    for item in convert(rows, columns):
+        if encode:
+            json.dumps(item, default=str)
+    elapsed = time.perf_counter() - start
+    rate = len(rows) / elapsed
+    print(f"  {name:<10} {elapsed:8.2f}s  {rate:>12,.0f} rows/s")
+    return rate
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    columns = [name for name, _ in DESCRIPTION]
+
+    print(f"Generating {count:,} synthetic rows ({len(columns)} columns)...")
+    rows = make_rows(count)
+
+    for encode in (False, True):
+        print(f"\n{'Convert + json.dumps' if encode else 'Convert only'}:")
+        before = run('before', convert_legacy, rows, columns, encode)
+        after = run('after', convert_planned, rows, columns, encode)
+        print(f"  speedup    {after / before:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
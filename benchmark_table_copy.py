@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the table export/restore engines
+Compares JSON export + per-row INSERT restore with COPY (text and binary)
+on a synthetic table
+
+Needs a DISPOSABLE database: the benchmark creates and drops its own tables.
+
+Usage: BENCHMARK_DB_URL=postgresql://... python benchmark_table_copy.py [rows]
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import tempfile
+from pathlib import Path
+import psycopg2
+from dotenv import load_dotenv
+from table_export import export_table_json, export_table_copy
+
+load_dotenv()
+
+SOURCE_TABLE = "benchmark_copy_source"
+TARGET_TABLE = "benchmark_copy_target"
+
+TABLE_DDL = """
+    CREATE TABLE "{name}" (
+        id bigint PRIMARY KEY,
+        user_id uuid,
+        title text,
+        amount numeric(12, 2),
+        is_active boolean,
+        payload jsonb,
+        created_at timestamptz
+    )
+"""
+
+
+def report(name: str, rows: int, elapsed: float, path: Path = None):
+    size = f"  {path.stat().st_size / (1024 * 1024):8.1f} MB" if path else ""
+    print(f"  {name:<24} {elapsed:8.2f}s  {rows / elapsed:>12,.0f} rows/s{size}")
+
+
+def create_source(conn, rows: int):
+    cursor = conn.cursor()
+    cursor.execute(f'DROP TABLE IF EXISTS "{SOURCE_TABLE}"')
+    cursor.execute(TABLE_DDL.format(name=SOURCE_TABLE))
+    cursor.execute(f"""
+        INSERT INTO "{SOURCE_TABLE}"
+        SELECT i,
+               md5(i::text)::uuid,
+               'Document ' || i,
+               i / 100.0,
+               i % 2 = 0,
+               jsonb_build_object('page', i % 50, 'source', 'upload'),
+               now() - i * interval '1 second'
+        FROM generate_series(1, %s) AS i
+    """, (rows,))
+    cursor.execute(f'ANALYZE "{SOURCE_TABLE}"')
+    conn.commit()
+    cursor.close()
+
+
+def reset_target(conn):
+    cursor = conn.cursor()
+    cursor.execute(f'DROP TABLE IF EXISTS "{TARGET_TABLE}"')
+    cursor.execute(TABLE_DDL.format(name=TARGET_TABLE))
+    conn.commit()
+    cursor.close()
+
+
+def restore_json_rows(conn, json_file: Path) -> int:
+    """Previous JSON restore: json.load the file, then one INSERT per row"""
+    with open(json_file, 'r') as f:
+        data = json.load(f)
+    cursor = conn.cursor()
+    columns = list(data[0].keys())
+    placeholders = ', '.join(['%s'] * len(columns))
+    columns_str = ', '.join([f'"{col}"' for col in columns])
+    insert_sql = f'INSERT INTO "{TARGET_TABLE}" ({columns_str}) VALUES ({placeholders})'
+    for row in data:
+        cursor.execute(insert_sql, [json.dumps(v) if isinstance(v, dict) else v for v in row.values()])
+    conn.commit()
+    cursor.close()
+    return len(data)
+
+
+def restore_copy(conn, copy_file: Path, copy_format: str, columns) -> int:
+    """COPY ... FROM STDIN, streaming the gzip file (same statement as SupabaseRestore._copy_into_table)"""
+    column_list = ', '.join(f'"{column}"' for column in columns)
+    cursor = conn.cursor()
+    with gzip.open(copy_file, 'rb') as f:
+        cursor.copy_expert(f'COPY "{TARGET_TABLE}" ({column_list}) FROM STDIN WITH (FORMAT {copy_format})', f)
+    row_count = cursor.rowcount
+    conn.commit()
+    cursor.close()
+    return row_count
+
+
+def main():
+    db_url = os.getenv('BENCHMARK_DB_URL')
+    if not db_url:
+        print("❌ Set BENCHMARK_DB_URL to a disposable database")
+        sys.exit(1)
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    conn = psycopg2.connect(db_url)
+
+    print(f"Creating {SOURCE_TABLE} with {rows:,} rows...")
+    create_source(conn, rows)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out_dir = Path(tmp)
+
+        print("\nExport:")
+        start = time.perf_counter()
+        export_table_json(conn, SOURCE_TABLE, out_dir, 'json', 2000)
+        conn.commit()
+        report('JSON (server cursor)', rows, time.perf_counter() - start, out_dir / f"{SOURCE_TABLE}.json")
+
+        copies = {}
+        for copy_format in ('text', 'binary'):
+            start = time.perf_counter()
+            result = export_table_copy(conn, SOURCE_TABLE, out_dir, copy_format, 'gzip')
+            conn.commit()
+            report(f'COPY {copy_format} (gzip)', rows, time.perf_counter() - start, out_dir / result['file'])
+            copies[copy_format] = result
+
+        print("\nRestore:")
+        reset_target(conn)
+        start = time.perf_counter()
+        restore_json_rows(conn, out_dir / f"{SOURCE_TABLE}.json")
+        report('JSON per-row INSERT', rows, time.perf_counter() - start)
+
+        for copy_format, result in copies.items():
+            reset_target(conn)
+            start = time.perf_counter()
+            restore_copy(conn, out_dir / result['file'], copy_format, result['columns'])
+            report(f'COPY {copy_format} FROM STDIN', rows, time.perf_counter() - start)
+
+    cursor = conn.cursor()
+    cursor.execute(f'DROP TABLE IF EXISTS "{SOURCE_TABLE}", "{TARGET_TABLE}"')
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,342 @@
+"""
+Chunk Store Module
+Content-defined chunking dedup store for backup folders
+
+Files are cut into variable-size chunks where a hash of the bytes just before
+a position hits a boundary pattern, so an insertion early in a file only
+changes the chunks around it. Chunks are stored once by SHA-256 and each backup is
+reduced to chunks.json, a manifest of chunk references per file.
+"""
+
+import os
+import json
+import re
+import zlib
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import Optional, Dict, List, Iterator, Iterable
+from tqdm import tqdm
+
+# Manifest written into a packed backup in place of its files
+CHUNK_MANIFEST = "chunks.json"
+
+# Files left in place when packing (list/restore read them before unpacking)
+UNPACKED_FILES = ("metadata.json", CHUNK_MANIFEST)
+
+# Chunk size bounds; the average must be a power of two
+MIN_CHUNK_SIZE = 16 * 1024
+AVG_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 256 * 1024
+
+# Read size when chunking and rebuilding files
+READ_SIZE = 8 * 1024 * 1024
+
+# Hash window behind a candidate cut point; a cut depends only on these bytes
+WINDOW_SIZE = 48
+
+# Candidate cut points: newlines (rows/lines in dumps and JSON) and one arbitrary byte value (binary data)
+_CANDIDATES = re.compile(b'[\n\xa7]')
+
+
+def _boundary_mask(avg_size: int) -> int:
+    """Mask giving roughly avg_size chunks on binary data (one candidate per 128 bytes); text cuts more often"""
+    bits = max(1, avg_size.bit_length() - 1 - 7)
+    return (1 << bits) - 1
+
+
+def _find_cut(data: bytes, start: int, end: int, min_size: int, mask: int) -> int:
+    """
+    Offset just past the first content-defined boundary in data[start:end], or end if none
+    
+    A per-byte rolling hash in Python runs at a few MB/s, so candidates are
+    found with a regex scan (C speed) and only there is the hash of the
+    preceding window computed. The cut still depends on local content only.
+    """
+    if end - start <= min_size:
+        return end
+    
+    for match in _CANDIDATES.finditer(data, start + min_size, end):
+        i = match.end()
+        if not zlib.crc32(data[i - WINDOW_SIZE:i]) & mask:
+            return i
+    return end
+
+
+def iter_chunks(fileobj, min_size: int = MIN_CHUNK_SIZE, avg_size: int = AVG_CHUNK_SIZE,
+                max_size: int = MAX_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Split a binary stream into content-defined chunks
+    
+    A cut is only searched for once max_size bytes are buffered (or the stream
+    has ended), so chunk boundaries never depend on read sizes.
+    """
+    mask = _boundary_mask(avg_size)
+    buffer = b''
+    eof = False
+    
+    while not eof:
+        data = fileobj.read(READ_SIZE)
+        eof = not data
+        buffer += data
+        
+        pos = 0
+        while len(buffer) - pos >= max_size or (eof and pos < len(buffer)):
+            cut = _find_cut(buffer, pos, min(len(buffer), pos + max_size), min_size, mask)
+            yield buffer[pos:cut]
+            pos = cut
+        buffer = buffer[pos:]
+
+
+class ChunkStore:
+    """Directory of chunks addressed by SHA-256 (<root>/<2 hex>/<sha256>)"""
+    
+    def __init__(self, root: str):
+        """
+        Initialize the chunk store
+        
+        Args:
+            root: Store directory, shared by all backups packed into it
+        """
+        self.root = Path(root)
+    
+    @classmethod
+    def for_backup(cls, backup_path: Path) -> Optional['ChunkStore']:
+        """Chunk store a packed backup points at, or None if the backup is not packed"""
+        manifest = load_chunk_manifest(backup_path)
+        if manifest is None:
+            return None
+        return cls(Path(backup_path) / manifest['store'])
+    
+    def chunk_path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+    
+    def put(self, data: bytes) -> tuple:
+        """
+        Store one chunk unless it is already there
+        
+        Returns:
+            (sha256 hex digest, True if the chunk was new)
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.chunk_path(digest)
+        if path.exists():
+            return digest, False
+        
+        # Write then rename, so a crashed pack never leaves a truncated chunk under a valid name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_name, path)
+        except Exception:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+        return digest, True
+    
+    def pack_file(self, file_path: Path) -> Dict:
+        """
+        Chunk one file into the store
+        
+        Returns:
+            Manifest entry: 'size', 'sha256', 'chunks' ([digest, length] pairs), 'new_bytes'
+        """
+        sha256 = hashlib.sha256()
+        chunks = []
+        size = 0
+        new_bytes = 0
+        
+        with open(file_path, 'rb') as f:
+            for data in iter_chunks(f):
+                sha256.update(data)
+                size += len(data)
+                digest, new = self.put(data)
+                if new:
+                    new_bytes += len(data)
+                chunks.append([digest, len(data)])
+        
+        return {'size': size, 'sha256': sha256.hexdigest(), 'chunks': chunks, 'new_bytes': new_bytes}
+    
+    def pack_backup(self, backup_path: Path) -> Dict:
+        """
+        Replace the files of a backup folder with chunk references
+        
+        metadata.json stays in place. Every other file is chunked into the
+        store, recorded in chunks.json and removed (empty directories too).
+        
+        Returns:
+            Summary for metadata.json: store location, file count, logical and newly stored bytes
+        """
+        backup_path = Path(backup_path)
+        self.root.mkdir(parents=True, exist_ok=True)
+        
+        file_paths = sorted(
+            path for path in backup_path.rglob('*')
+            if path.is_file() and path.relative_to(backup_path).as_posix() not in UNPACKED_FILES
+        )
+        
+        files = {}
+        total_bytes = 0
+        new_bytes = 0
+        for path in tqdm(file_paths, desc="  Chunking files"):
+            entry = self.pack_file(path)
+            new_bytes += entry.pop('new_bytes')
+            total_bytes += entry['size']
+            files[path.relative_to(backup_path).as_posix()] = entry
+        
+        manifest = {
+            'store': os.path.relpath(self.root, backup_path),
+            'chunk_sizes': {'min': MIN_CHUNK_SIZE, 'avg': AVG_CHUNK_SIZE, 'max': MAX_CHUNK_SIZE},
+            'files': files
+        }
+        with open(backup_path / CHUNK_MANIFEST, 'w') as f:
+            json.dump(manifest, f)
+        
+        # Only drop the originals once the manifest referencing them is on disk
+        for path in file_paths:
+            path.unlink()
+        for directory in sorted((p for p in backup_path.rglob('*') if p.is_dir()), reverse=True):
+            if not any(directory.iterdir()):
+                directory.rmdir()
+        
+        return {
+            'store': manifest['store'],
+            'files': len(files),
+            'bytes': total_bytes,
+            'new_bytes': new_bytes
+        }
+    
+    def unpack_file(self, entry: Dict, dest: Path):
+        """Rebuild one file from its chunks, checking the whole-file SHA-256"""
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        sha256 = hashlib.sha256()
+        with open(dest, 'wb') as out:
+            for digest, _ in entry['chunks']:
+                with open(self.chunk_path(digest), 'rb') as f:
+                    data = f.read()
+                sha256.update(data)
+                out.write(data)
+        
+        if sha256.hexdigest() != entry['sha256']:
+            raise Exception(f"Checksum mismatch rebuilding {dest}: chunk store is corrupt")
+    
+    def read_file(self, backup_path: Path, name: str) -> Optional[bytes]:
+        """
+        Contents of one (small) file of a packed backup, without rebuilding it on disk
+        
+        Args:
+            name: Path relative to the backup folder, e.g. 'storage/buckets_metadata.json'
+        
+        Returns:
+            The file's bytes, or None if the backup has no such file
+        """
+        entry = load_chunk_manifest(Path(backup_path))['files'].get(name)
+        if entry is None:
+            return None
+        
+        parts = []
+        for digest, _ in entry['chunks']:
+            with open(self.chunk_path(digest), 'rb') as f:
+                parts.append(f.read())
+        data = b''.join(parts)
+        
+        if hashlib.sha256(data).hexdigest() != entry['sha256']:
+            raise Exception(f"Checksum mismatch reading {name}: chunk store is corrupt")
+        return data
+    
+    def unpack_backup(self, backup_path: Path, dest: Path, prefixes: Optional[Iterable[str]] = None) -> int:
+        """
+        Rebuild the files of a packed backup under dest (plus its metadata.json)
+        
+        Args:
+            prefixes: Only rebuild files whose path starts with one of these (default: all)
+        
+        Returns:
+            Number of files rebuilt
+        """
+        backup_path = Path(backup_path)
+        dest = Path(dest)
+        manifest = load_chunk_manifest(backup_path)
+        prefixes = tuple(prefixes) if prefixes is not None else None
+        
+        dest.mkdir(parents=True, exist_ok=True)
+        if (backup_path / "metadata.json").exists():
+            with open(backup_path / "metadata.json", 'rb') as src, open(dest / "metadata.json", 'wb') as out:
+                out.write(src.read())
+        
+        names = [name for name in manifest['files'] if prefixes is None or name.startswith(prefixes)]
+        for name in tqdm(names, desc="  Rebuilding files"):
+            self.unpack_file(manifest['files'][name], dest / name)
+        
+        return len(names)
+    
+    def verify_backup(self, backup_path: Path, full: bool = False) -> Dict:
+        """
+        Check that every chunk a packed backup references is in the store
+        
+        Args:
+            full: Also re-hash every chunk (reads the whole backup)
+        
+        Returns:
+            Dict with 'files', 'chunks', 'missing' and 'corrupt' (lists of digests)
+        """
+        manifest = load_chunk_manifest(backup_path)
+        digests = {digest for entry in manifest['files'].values() for digest, _ in entry['chunks']}
+        
+        missing = []
+        corrupt = []
+        for digest in digests:
+            path = self.chunk_path(digest)
+            if not path.exists():
+                missing.append(digest)
+            elif full:
+                with open(path, 'rb') as f:
+                    if hashlib.sha256(f.read()).hexdigest() != digest:
+                        corrupt.append(digest)
+        
+        return {
+            'files': len(manifest['files']),
+            'chunks': len(digests),
+            'missing': sorted(missing),
+            'corrupt': sorted(corrupt)
+        }
+    
+    def prune(self, backup_paths: List[Path]) -> Dict:
+        """
+        Delete chunks no longer referenced by any of the given packed backups
+        
+        Pass every backup that uses this store; chunks only referenced by
+        backups missing from the list are deleted.
+        
+        Returns:
+            Dict with 'kept', 'deleted' and 'freed_bytes'
+        """
+        live = set()
+        for backup_path in backup_paths:
+            manifest = load_chunk_manifest(backup_path)
+            if manifest and (Path(backup_path) / manifest['store']).resolve() == self.root.resolve():
+                live.update(digest for entry in manifest['files'].values() for digest, _ in entry['chunks'])
+        
+        kept = 0
+        deleted = 0
+        freed = 0
+        for path in self.root.glob('*/*'):
+            if path.name in live:
+                kept += 1
+                continue
+            freed += path.stat().st_size
+            path.unlink()
+            deleted += 1
+        
+        return {'kept': kept, 'deleted': deleted, 'freed_bytes': freed}
+
+
+def load_chunk_manifest(backup_path: Path) -> Optional[Dict]:
+    """chunks.json of a packed backup, or None if the backup holds its files directly"""
+    manifest_file = Path(backup_path) / CHUNK_MANIFEST
+    if not manifest_file.exists():
+        return None
+    with open(manifest_file, 'r') as f:
+        return json.load(f)
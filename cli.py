@@ -7,10 +7,14 @@ Command-line interface for backing up and restoring Supabase projects
 import os
 import sys
 import click
+import psycopg2
 from pathlib import Path
 from dotenv import load_dotenv
 from supabase_backup import SupabaseBackup
 from supabase_restore import SupabaseRestore
+from schema_fingerprint import (
+    schema_fingerprint, changed_components, load_backup_fingerprint, latest_backup_fingerprint
+)
 from tabulate import tabulate
 from datetime import datetime
 
@@ -56,7 +60,49 @@ def cli():
 @click.option('--no-edge-functions', is_flag=True, help='Skip edge functions backup')
 @click.option('--output', '-o', help='Custom backup directory path')
 @click.option('--project-name', '-p', help='Project name prefix for backup files (e.g., "ipa")')
-def backup(no_storage, no_auth, no_edge_functions, output, project_name):
+@click.option('--jobs', '-j', type=click.IntRange(min=1), default=1,
+              help='Parallel pg_dump jobs (more than 1 writes a directory-format dump)')
+@click.option('--compress', type=click.Choice(['gzip', 'zstd']), default=None,
+              help='Stream the SQL dump through a compressor while writing it (ignored with --jobs > 1)')
+@click.option('--json-format', type=click.Choice(['json', 'ndjson']), default='json',
+              help='Table export format: streamed JSON array or newline-delimited JSON')
+@click.option('--itersize', type=click.IntRange(min=1), default=2000,
+              help='Rows fetched per round-trip when exporting tables')
+@click.option('--table-workers', type=click.IntRange(min=1), default=1,
+              help='Worker processes exporting tables to JSON in parallel (largest tables first)')
+@click.option('--chunk-rows', type=click.IntRange(min=0), default=1_000_000,
+              help='With --table-workers, split tables above this many rows into parallel parts (0 = never)')
+@click.option('--copy-format', type=click.Choice(['text', 'binary']), default=None,
+              help='Export tables with COPY (compressed) instead of JSON')
+@click.option('--base', type=click.Path(exists=True, file_okay=False),
+              help='Previous backup to reuse unchanged table exports and storage objects from (incremental backup)')
+@click.option('--delta-table', 'delta_tables', multiple=True,
+              help='Export this table as a primary-key chunk delta against --base (repeatable)')
+@click.option('--delta-chunk-keys', type=click.IntRange(min=1), default=100_000,
+              help='Primary-key values per delta chunk')
+@click.option('--dedup', is_flag=True,
+              help='Store the backup as chunk references in a content-defined chunk store')
+@click.option('--chunk-store', type=click.Path(file_okay=False),
+              help='Chunk store directory for --dedup (default: <backup dir>/.chunks)')
+@click.option('--reuse-schema', is_flag=True,
+              help='Dump schema and data as separate sections; reuse the schema sections of --base if unchanged '
+                   '(not with --jobs > 1)')
+@click.option('--component-workers', type=click.IntRange(min=1), default=4,
+              help='Backup components (database, storage, auth, ...) run concurrently, this many at a time')
+@click.option('--storage-workers', type=click.IntRange(min=1), default=8,
+              help='Concurrent storage folder listings and object downloads')
+@click.option('--download-buffer-kb', type=click.IntRange(min=4), default=1024,
+              help='Memory per storage download in KiB; objects are streamed to disk in blocks of this size')
+@click.option('--storage-blobs', is_flag=True,
+              help='Store each storage object once by SHA-256 and hard-link it into the backup folders')
+@click.option('--blob-store', type=click.Path(file_okay=False),
+              help='Blob store directory for --storage-blobs (default: <backup dir>/.blobs)')
+@click.option('--no-snapshot', is_flag=True,
+              help='Do not pin database components to one exported snapshot')
+def backup(no_storage, no_auth, no_edge_functions, output, project_name, jobs, compress, json_format, itersize,
+           table_workers, chunk_rows, copy_format, base, delta_tables, delta_chunk_keys, dedup, chunk_store,
+           reuse_schema, component_workers, storage_workers, download_buffer_kb, storage_blobs,
+           blob_store, no_snapshot):
     """Create a new backup of your Supabase project"""
     config = get_config()
     
@@ -66,6 +112,11 @@ def backup(no_storage, no_auth, no_edge_functions, output, project_name):
     if project_name:
         config['project_name'] = project_name
     
+    if reuse_schema and jobs > 1:
+        # A parallel dump is one directory-format archive, which has no separate schema sections
+        click.echo("❌ Error: --reuse-schema cannot be combined with --jobs > 1", err=True)
+        sys.exit(1)
+    
     click.echo("🚀 Starting Supabase backup...\n")
     
     backup_handler = SupabaseBackup(
@@ -73,7 +124,26 @@ def backup(no_storage, no_auth, no_edge_functions, output, project_name):
         supabase_key=config['supabase_key'],
         db_url=config['db_url'],
         backup_dir=config['backup_dir'],
-        project_name=config['project_name']
+        project_name=config['project_name'],
+        jobs=jobs,
+        compression=compress,
+        json_format=json_format,
+        itersize=itersize,
+        table_workers=table_workers,
+        consistent_snapshot=not no_snapshot,
+        chunk_rows=chunk_rows,
+        copy_format=copy_format,
+        base_backup=base,
+        delta_tables=list(delta_tables),
+        delta_chunk_keys=delta_chunk_keys,
+        dedup=dedup,
+        chunk_store=chunk_store,
+        reuse_schema=reuse_schema,
+        component_workers=component_workers,
+        storage_workers=storage_workers,
+        download_buffer=download_buffer_kb * 1024,
+        storage_blobs=storage_blobs,
+        blob_store=blob_store
     )
     
     try:
@@ -101,8 +171,22 @@ def backup(no_storage, no_auth, no_edge_functions, output, project_name):
               help='Restore mode: clean (drop conflicts), merge (skip existing), force (drop all)')
 @click.option('--yes', '-y', is_flag=True, help='Skip confirmation prompt')
 @click.option('--latest', is_flag=True, help='Restore the latest backup')
+@click.option('--jobs', '-j', type=click.IntRange(min=1), default=1,
+              help='Parallel pg_restore workers for custom/directory-format dumps')
+@click.option('--task-workers', type=click.IntRange(min=1), default=4,
+              help='Restore steps (database, storage, auth, ...) run concurrently once their dependencies are done')
+@click.option('--storage-workers', type=click.IntRange(min=1), default=8,
+              help='Concurrent storage object uploads')
+@click.option('--reupload-all', is_flag=True,
+              help='Upload every storage object, even those the target already holds with the same checksum')
+@click.option('--from-tables', is_flag=True,
+              help="Load public tables from the backup's table export (JSON/COPY) instead of the dump's data; "
+                   "the schema comes from a sectioned or custom/directory dump")
+@click.option('--batch-size', type=click.IntRange(min=0), default=0,
+              help='With --from-tables, commit JSON table loads every N rows (0 = once per table)')
 def restore(backup_path, no_database, no_storage, no_auth, no_edge_functions, 
-           no_roles, no_realtime, no_webhooks, mode, yes, latest):
+           no_roles, no_realtime, no_webhooks, mode, yes, latest, jobs, task_workers, storage_workers,
+           reupload_all, from_tables, batch_size):
     """Restore a backup to your Supabase project"""
     config = get_config()
     
@@ -130,7 +214,12 @@ def restore(backup_path, no_database, no_storage, no_auth, no_edge_functions,
     restore_handler = SupabaseRestore(
         supabase_url=config['supabase_url'],
         supabase_key=config['supabase_key'],
-        db_url=config['db_url']
+        db_url=config['db_url'],
+        jobs=jobs,
+        batch_size=batch_size,
+        task_workers=task_workers,
+        storage_workers=storage_workers,
+        skip_unchanged=not reupload_all
     )
     
     try:
@@ -145,7 +234,8 @@ def restore(backup_path, no_database, no_storage, no_auth, no_edge_functions,
             restore_webhooks=not no_webhooks,
             deploy_functions=True,  # Auto-deploy edge functions
             mode=mode,
-            confirm=yes
+            confirm=yes,
+            from_tables=from_tables
         )
     except Exception as e:
         click.echo(f"\n❌ Restore failed: {e}", err=True)
@@ -223,11 +313,18 @@ def verify(backup_path):
         click.echo(f"  Storage: {'✅' if results['storage'] else '❌'}")
         if 'bucket_count' in results['details']:
             click.echo(f"    Buckets: {results['details']['bucket_count']}")
+        if results['details'].get('missing_buckets'):
+            click.echo(f"    Missing buckets: {', '.join(results['details']['missing_buckets'])}")
         
         click.echo(f"  Auth: {'✅' if results['auth'] else '❌'}")
         if 'user_count' in results['details']:
             click.echo(f"    Users: {results['details']['user_count']}")
         
+        if 'chunk_store' in results:
+            click.echo(f"  Chunk store: {'✅' if results['chunk_store'] else '❌'}")
+            if 'chunk_count' in results['details']:
+                click.echo(f"    Chunks: {results['details']['chunk_count']}")
+        
         # Show errors if any
         errors = {k: v for k, v in results['details'].items() if k.endswith('_error')}
         if errors:
@@ -240,6 +337,99 @@ def verify(backup_path):
         sys.exit(1)
 
 
+@cli.command(name='schema-changed')
+@click.option('--against', type=click.Path(exists=True, file_okay=False),
+              help='Backup to compare with (default: the most recent backup with a recorded fingerprint)')
+@click.option('--backup-dir', help='Custom backup directory to search for the most recent backup')
+def schema_changed(against, backup_dir):
+    """
+    Check whether the database schema changed since a backup (catalog queries only)
+    
+    Exit status: 0 if the schema changed (or there is nothing to compare with), 1 if unchanged, 2 on error.
+    """
+    config = get_config()
+    
+    if backup_dir:
+        config['backup_dir'] = backup_dir
+    
+    try:
+        if against:
+            previous_path, previous = Path(against), load_backup_fingerprint(against)
+        else:
+            previous_path, previous = latest_backup_fingerprint(config['backup_dir']) or (None, None)
+        
+        conn = psycopg2.connect(config['db_url'])
+        try:
+            current = schema_fingerprint(conn)
+        finally:
+            conn.close()
+    except Exception as e:
+        click.echo(f"❌ Schema check failed: {e}", err=True)
+        sys.exit(2)
+    
+    click.echo(f"Schema fingerprint: {current['fingerprint']}")
+    
+    if not previous:
+        click.echo("No previous fingerprint to compare with: treating schema as changed")
+        sys.exit(0)
+    
+    changed = changed_components(current, previous)
+    if changed:
+        click.echo(f"🔄 Schema changed since {previous_path.name}: {', '.join(changed)}")
+        sys.exit(0)
+    
+    click.echo(f"✓ Schema unchanged since {previous_path.name}")
+    sys.exit(1)
+
+
+@cli.command(name='prune-chunks')
+@click.option('--backup-dir', help='Custom backup directory whose chunk store to prune')
+@click.option('--chunk-store', type=click.Path(file_okay=False),
+              help='Chunk store directory (default: <backup dir>/.chunks)')
+def prune_chunks(backup_dir, chunk_store):
+    """Delete chunks no longer referenced by any backup (after removing old backups)"""
+    config = get_config()
+    
+    if backup_dir:
+        config['backup_dir'] = backup_dir
+    
+    backup_handler = SupabaseBackup(
+        supabase_url=config['supabase_url'],
+        supabase_key=config['supabase_key'],
+        db_url=config['db_url'],
+        backup_dir=config['backup_dir'],
+        chunk_store=chunk_store
+    )
+    
+    result = backup_handler.prune_chunk_store()
+    click.echo(f"🧹 Deleted {result['deleted']} unreferenced chunks "
+               f"({result['freed_bytes'] / (1024 * 1024):.1f} MB), kept {result['kept']}")
+
+
+@cli.command(name='prune-blobs')
+@click.option('--backup-dir', help='Custom backup directory whose blob store to prune')
+@click.option('--blob-store', type=click.Path(file_okay=False),
+              help='Blob store directory (default: <backup dir>/.blobs)')
+def prune_blobs(backup_dir, blob_store):
+    """Delete storage blobs no backup links to any more (after removing old backups)"""
+    config = get_config()
+    
+    if backup_dir:
+        config['backup_dir'] = backup_dir
+    
+    backup_handler = SupabaseBackup(
+        supabase_url=config['supabase_url'],
+        supabase_key=config['supabase_key'],
+        db_url=config['db_url'],
+        backup_dir=config['backup_dir'],
+        blob_store=blob_store
+    )
+    
+    result = backup_handler.prune_blob_store()
+    click.echo(f"🧹 Deleted {result['deleted']} unreferenced blobs "
+               f"({result['freed_bytes'] / (1024 * 1024):.1f} MB), kept {result['kept']}")
+
+
 @cli.command()
 def config():
     """Show current configuration"""
@@ -0,0 +1,230 @@
+"""
+Schema Fingerprint Module
+Cheap fingerprint of the database schema, computed from the system catalogs
+
+Each catalog query returns one md5 over the definitions it covers, in a
+stable order. Comparing fingerprints tells whether pg_dump's schema sections
+(pre-data / post-data) would come out the same, without running pg_dump.
+"""
+
+import json
+import hashlib
+from pathlib import Path
+from typing import Dict, Optional
+
+# Schemas pg_dump never emits
+_USER_NAMESPACES = """
+    SELECT oid FROM pg_namespace
+    WHERE nspname NOT IN ('pg_catalog', 'information_schema')
+    AND nspname NOT LIKE 'pg_toast%'
+    AND nspname NOT LIKE 'pg_temp%'
+"""
+
+# One query per catalog area; each returns a single md5 (NULL when the area is empty)
+FINGERPRINT_QUERIES = {
+    'namespaces': f"""
+        SELECT md5(string_agg(nspname, ',' ORDER BY nspname))
+        FROM pg_namespace WHERE oid IN ({_USER_NAMESPACES})
+    """,
+    'extensions': """
+        SELECT md5(string_agg(extname || ' ' || extversion, ',' ORDER BY extname))
+        FROM pg_extension
+    """,
+    'classes': f"""
+        SELECT md5(string_agg(
+            c.relnamespace::regnamespace || '.' || c.relname || ' ' || c.relkind || ' ' || c.relpersistence
+            || ' ' || c.relrowsecurity || ' ' || c.relforcerowsecurity
+            || ' ' || coalesce(CASE WHEN c.relkind IN ('v', 'm') THEN pg_get_viewdef(c.oid) END, '')
+            || ' ' || coalesce(pg_get_partkeydef(c.oid), '')
+            || ' ' || coalesce(pg_get_expr(c.relpartbound, c.oid), '')
+            || ' ' || coalesce(array_to_string(c.reloptions, ','), ''),
+            ',' ORDER BY c.relnamespace::regnamespace::text, c.relname))
+        FROM pg_class c
+        WHERE c.relnamespace IN ({_USER_NAMESPACES})
+        AND c.relkind IN ('r', 'v', 'm', 'S', 'f', 'p', 'c')
+    """,
+    'columns': f"""
+        SELECT md5(string_agg(
+            c.oid::regclass || '.' || a.attname || ' ' || format_type(a.atttypid, a.atttypmod)
+            || ' ' || a.attnotnull || ' ' || a.attidentity || ' ' || a.attgenerated
+            || ' ' || coalesce(pg_get_expr(d.adbin, d.adrelid), ''),
+            ',' ORDER BY c.oid::regclass::text, a.attnum))
+        FROM pg_attribute a
+        JOIN pg_class c ON c.oid = a.attrelid
+        LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+        WHERE c.relnamespace IN ({_USER_NAMESPACES})
+        AND a.attnum > 0 AND NOT a.attisdropped
+    """,
+    'constraints': f"""
+        SELECT md5(string_agg(
+            conrelid::regclass || ' ' || conname || ' ' || pg_get_constraintdef(oid),
+            ',' ORDER BY conrelid::regclass::text, conname))
+        FROM pg_constraint
+        WHERE connamespace IN ({_USER_NAMESPACES})
+    """,
+    'indexes': f"""
+        SELECT md5(string_agg(pg_get_indexdef(i.indexrelid), ',' ORDER BY i.indexrelid::regclass::text))
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relnamespace IN ({_USER_NAMESPACES})
+    """,
+    'sequences': f"""
+        SELECT md5(string_agg(
+            s.seqrelid::regclass || ' ' || format_type(s.seqtypid, NULL) || ' ' || s.seqstart || ' '
+            || s.seqincrement || ' ' || s.seqmin || ' ' || s.seqmax || ' ' || s.seqcache || ' ' || s.seqcycle,
+            ',' ORDER BY s.seqrelid::regclass::text))
+        FROM pg_sequence s
+        JOIN pg_class c ON c.oid = s.seqrelid
+        WHERE c.relnamespace IN ({_USER_NAMESPACES})
+    """,
+    'types': f"""
+        SELECT md5(string_agg(
+            t.typnamespace::regnamespace || '.' || t.typname || ' ' || t.typtype
+            || ' ' || coalesce((SELECT string_agg(enumlabel, ',' ORDER BY enumsortorder)
+                                FROM pg_enum WHERE enumtypid = t.oid), '')
+            || ' ' || coalesce(domain_checks.defs, ''),
+            ',' ORDER BY t.typnamespace::regnamespace::text, t.typname))
+        FROM pg_type t
+        LEFT JOIN LATERAL (
+            SELECT string_agg(pg_get_constraintdef(oid), ',' ORDER BY conname) AS defs
+            FROM pg_constraint WHERE contypid = t.oid
+        ) domain_checks ON true
+        WHERE t.typnamespace IN ({_USER_NAMESPACES})
+        AND t.typtype IN ('e', 'd', 'r', 'm')
+    """,
+    'functions': f"""
+        SELECT md5(string_agg(
+            p.oid::regprocedure || ' ' || pg_get_function_result(p.oid) || ' ' || p.prokind
+            || ' ' || p.provolatile || ' ' || p.prosecdef || ' ' || md5(p.prosrc)
+            || ' ' || coalesce(array_to_string(p.proconfig, ','), ''),
+            ',' ORDER BY p.oid::regprocedure::text))
+        FROM pg_proc p
+        WHERE p.pronamespace IN ({_USER_NAMESPACES})
+        AND NOT EXISTS (SELECT 1 FROM pg_depend d WHERE d.objid = p.oid AND d.deptype = 'e')
+    """,
+    'policies': """
+        SELECT md5(string_agg(
+            polrelid::regclass || ' ' || polname || ' ' || polcmd || ' ' || polpermissive
+            || ' ' || polroles::text || ' ' || coalesce(pg_get_expr(polqual, polrelid), '')
+            || ' ' || coalesce(pg_get_expr(polwithcheck, polrelid), ''),
+            ',' ORDER BY polrelid::regclass::text, polname))
+        FROM pg_policy
+    """,
+    'triggers': f"""
+        SELECT md5(string_agg(pg_get_triggerdef(t.oid) || ' ' || t.tgenabled,
+                              ',' ORDER BY t.tgrelid::regclass::text, t.tgname))
+        FROM pg_trigger t
+        JOIN pg_class c ON c.oid = t.tgrelid
+        WHERE NOT t.tgisinternal
+        AND c.relnamespace IN ({_USER_NAMESPACES})
+    """,
+    'rules': """
+        SELECT md5(string_agg(schemaname || '.' || tablename || ' ' || definition,
+                              ',' ORDER BY schemaname, tablename, rulename))
+        FROM pg_rules
+        WHERE schemaname NOT IN ('pg_catalog', 'information_schema')
+    """,
+    'statistics': f"""
+        SELECT md5(string_agg(pg_get_statisticsobjdef(s.oid), ',' ORDER BY s.stxnamespace::regnamespace::text, s.stxname))
+        FROM pg_statistic_ext s
+        WHERE s.stxnamespace IN ({_USER_NAMESPACES})
+    """,
+    # Rows as jsonb, so options added by newer servers (row filters, column lists, ...) are covered too
+    'publications': """
+        SELECT md5(coalesce((SELECT string_agg((to_jsonb(p) - 'oid' - 'pubowner')::text, ',' ORDER BY p.pubname)
+                             FROM pg_publication p), '')
+                   || '|' || coalesce((SELECT string_agg(to_jsonb(t)::text, ','
+                                                         ORDER BY t.pubname, t.schemaname, t.tablename)
+                                       FROM pg_publication_tables t), '')
+                   || '|' || coalesce((SELECT string_agg(p.pubname || ' ' || r.prrelid::regclass || ' '
+                                                         || (to_jsonb(r) - 'oid' - 'prpubid' - 'prrelid')::text,
+                                                         ',' ORDER BY p.pubname, r.prrelid::regclass::text)
+                                       FROM pg_publication_rel r JOIN pg_publication p ON p.oid = r.prpubid), ''))
+    """,
+    'event_triggers': """
+        SELECT md5(string_agg(evtname || ' ' || evtevent || ' ' || evtfoid::regproc || ' ' || evtenabled
+                              || ' ' || coalesce(array_to_string(evttags, ','), ''), ',' ORDER BY evtname))
+        FROM pg_event_trigger
+    """,
+    # Comments on every user object (OIDs from FirstNormalObjectId up), not just relations
+    'comments': """
+        SELECT md5(string_agg(pg_describe_object(d.classoid, d.objoid, d.objsubid) || ' ' || d.description,
+                              ',' ORDER BY pg_describe_object(d.classoid, d.objoid, d.objsubid)))
+        FROM pg_description d
+        WHERE d.objoid >= 16384
+    """,
+}
+
+
+def schema_fingerprint(conn) -> Dict:
+    """
+    Fingerprint the schema through catalog queries only (no table data is read)
+    
+    Covers every schema pg_dump would emit: namespaces, extensions, relations
+    (view definitions, storage options, partition bounds), columns and
+    defaults, constraints, indexes, sequence options, enum/domain types,
+    functions, RLS policies, triggers, rules, extended statistics,
+    publications and their tables, event triggers and comments on any user
+    object. Owners and grants are left out, like the dumps (--no-owner --no-acl).
+    
+    Returns:
+        Dict with 'fingerprint' (sha256 over all areas) and 'components' (md5 per area)
+    """
+    cursor = conn.cursor()
+    components = {}
+    try:
+        for name, query in FINGERPRINT_QUERIES.items():
+            cursor.execute(query)
+            components[name] = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+    
+    combined = hashlib.sha256()
+    for name in sorted(components):
+        combined.update(f"{name}={components[name]}\n".encode())
+    
+    return {
+        'fingerprint': combined.hexdigest(),
+        'components': components
+    }
+
+
+def changed_components(current: Dict, previous: Optional[Dict]) -> list:
+    """Areas whose md5 differs between two fingerprints (all areas when there is no previous one)"""
+    if not previous:
+        return sorted(current['components'])
+    previous_components = previous.get('components', {})
+    return sorted(
+        name for name, digest in current['components'].items()
+        if previous_components.get(name) != digest
+    )
+
+
+def load_backup_fingerprint(backup_path: Path) -> Optional[Dict]:
+    """Schema fingerprint recorded in a backup's metadata.json, if any"""
+    metadata_file = Path(backup_path) / "metadata.json"
+    if not metadata_file.exists():
+        return None
+    with open(metadata_file, 'r') as f:
+        return (json.load(f).get('database') or {}).get('schema')
+
+
+def latest_backup_fingerprint(backup_dir: Path) -> Optional[tuple]:
+    """
+    Most recent backup under backup_dir (project subfolders included) that recorded a fingerprint
+    
+    Returns:
+        (backup path, fingerprint) or None
+    """
+    latest = None
+    for metadata_file in Path(backup_dir).rglob("metadata.json"):
+        try:
+            with open(metadata_file, 'r') as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            continue
+        schema = (metadata.get('database') or {}).get('schema')
+        if schema and (latest is None or metadata.get('timestamp', '') > latest[0]):
+            latest = (metadata.get('timestamp', ''), metadata_file.parent, schema)
+    
+    return (latest[1], latest[2]) if latest else None
@@ -19,6 +19,11 @@ setup(
     py_modules=[
         'supabase_backup',
         'supabase_restore',
+        'table_export',
+        'chunk_store',
+        'schema_fingerprint',
+        'task_graph',
+        'storage_transfer',
         'cli',
         'example_usage'
     ],
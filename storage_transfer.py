@@ -0,0 +1,524 @@
+"""
+Storage Transfer Module
+Concurrent engine for moving storage objects: a work pool whose tasks can
+queue more tasks (folder listings queue downloads and sub-folder listings),
+thread-safe progress reporting in objects/s and MB/s, streaming downloads
+and a content-addressed blob store that backup trees hard-link into
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, Union
+from datetime import datetime, timezone
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+from tqdm import tqdm
+
+# Entries per storage list request; the API defaults to 100 and silently stops there
+LIST_PAGE_SIZE = 1000
+
+# Stable order so offsets stay valid across pages
+LIST_SORT = {'column': 'name', 'order': 'asc'}
+
+# Bytes held in memory per download; the response body is written out in blocks of this size
+DOWNLOAD_BUFFER_SIZE = 1024 * 1024
+
+# (connect, read) timeouts for object downloads; the read timeout is per block, not per object
+DOWNLOAD_TIMEOUT = (10, 300)
+
+# (connect, read) timeouts for object uploads
+UPLOAD_TIMEOUT = (10, 600)
+
+# Object manifest of a storage backup, inside its storage/ folder
+OBJECT_MANIFEST = "objects.json"
+
+_local = threading.local()
+
+
+class WorkPool:
+    """
+    Bounded thread pool that can be fed from inside its own tasks
+    
+    join() returns once every task, including those submitted by other
+    tasks while running, has finished. Task exceptions are printed and
+    counted, never raised, so one bad object cannot stop the transfer.
+    """
+    
+    def __init__(self, max_workers: int = 8):
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self.errors = 0
+    
+    def submit(self, func: Callable, *args, **kwargs):
+        """Queue a task; once the pool is cancelled, new tasks are dropped (None is returned)"""
+        with self._lock:
+            if self._cancelled:
+                return None
+            future = self.executor.submit(func, *args, **kwargs)
+            self._pending.add(future)
+        return future
+    
+    def cancel(self):
+        """Drop every task that has not started yet and wait for the running ones"""
+        with self._lock:
+            self._cancelled = True
+            pending = set(self._pending)
+        for future in pending:
+            future.cancel()
+        # Executor.shutdown(cancel_futures=True) would do this, but only from Python 3.9
+        self.executor.shutdown(wait=True)
+    
+    def join(self):
+        """Wait until the pool is drained, then shut it down"""
+        try:
+            while True:
+                with self._lock:
+                    pending = set(self._pending)
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                with self._lock:
+                    self._pending -= done
+                for future in done:
+                    error = future.exception()
+                    if error is not None:
+                        self.errors += 1
+                        print(f"      ⚠ Warning: {error}")
+        finally:
+            self.executor.shutdown(wait=True)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.join()
+        else:
+            self.cancel()
+
+
+class TransferProgress:
+    """
+    Thread-safe object/byte counters behind a tqdm bar whose total grows as listings discover objects
+    
+    Counts can also be kept per group (e.g. per bucket) by passing group=;
+    a group's time runs from its first discovered object to its last finished one.
+    """
+    
+    def __init__(self, desc: str):
+        self.bar = tqdm(total=0, desc=desc, unit='obj')
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.objects = 0
+        self.bytes = 0
+        self.failed = 0
+        self.reused = 0
+        self.reused_bytes = 0
+        self.groups: Dict[str, Dict] = {}
+    
+    def _group(self, group: Optional[str]) -> Optional[Dict]:
+        if group is None:
+            return None
+        if group not in self.groups:
+            now = time.perf_counter()
+            self.groups[group] = {'objects': 0, 'bytes': 0, 'failed': 0, 'reused': 0, 'reused_bytes': 0,
+                                  'first': now, 'last': now}
+        return self.groups[group]
+    
+    def discovered(self, count: int, group: Optional[str] = None):
+        with self.lock:
+            self._group(group)
+            self.bar.total += count
+            self.bar.refresh()
+    
+    def done(self, size: int = 0, failed: bool = False, group: Optional[str] = None):
+        with self.lock:
+            counters = self._group(group)
+            if failed:
+                self.failed += 1
+            else:
+                self.objects += 1
+                self.bytes += size
+            if counters is not None:
+                counters['failed' if failed else 'objects'] += 1
+                counters['bytes'] += 0 if failed else size
+                counters['last'] = time.perf_counter()
+            elapsed = max(time.perf_counter() - self.started, 1e-6)
+            self.bar.set_postfix_str(f"{self.bytes / (1024 * 1024) / elapsed:.1f} MB/s", refresh=False)
+            self.bar.update(1)
+    
+    def reuse(self, size: int = 0, group: Optional[str] = None):
+        """Count an object that was carried over instead of transferred"""
+        with self.lock:
+            counters = self._group(group)
+            if counters is not None:
+                counters['reused'] += 1
+                counters['reused_bytes'] += size
+                counters['last'] = time.perf_counter()
+            self.reused += 1
+            self.reused_bytes += size
+            self.bar.update(1)
+    
+    def close(self) -> dict:
+        """Close the bar and return the totals and rates"""
+        self.bar.close()
+        elapsed = max(time.perf_counter() - self.started, 1e-6)
+        return {
+            'objects': self.objects,
+            'bytes': self.bytes,
+            'failed': self.failed,
+            'reused': self.reused,
+            'reused_bytes': self.reused_bytes,
+            'seconds': round(elapsed, 2),
+            'objects_per_second': round(self.objects / elapsed, 1),
+            'mb_per_second': round(self.bytes / (1024 * 1024) / elapsed, 2),
+            'groups': {name: self._group_stats(counters) for name, counters in self.groups.items()}
+        }
+    
+    @staticmethod
+    def _group_stats(counters: Dict) -> Dict:
+        elapsed = max(counters['last'] - counters['first'], 1e-6)
+        return {
+            'objects': counters['objects'],
+            'bytes': counters['bytes'],
+            'failed': counters['failed'],
+            'reused': counters['reused'],
+            'reused_bytes': counters['reused_bytes'],
+            'seconds': round(elapsed, 2),
+            'objects_per_second': round(counters['objects'] / elapsed, 1),
+            'mb_per_second': round(counters['bytes'] / (1024 * 1024) / elapsed, 2)
+        }
+
+
+def format_transfer_stats(stats: dict) -> str:
+    """One-line summary of TransferProgress.close() totals"""
+    line = (f"{stats['objects']} objects, {stats['bytes'] / (1024 * 1024):.1f} MB in {stats['seconds']:.1f}s "
+            f"({stats['objects_per_second']:.1f} obj/s, {stats['mb_per_second']:.2f} MB/s)")
+    if stats.get('reused'):
+        line += f", {stats['reused']} unchanged ({stats['reused_bytes'] / (1024 * 1024):.1f} MB) reused"
+    if stats['failed']:
+        line += f", {stats['failed']} failed"
+    return line
+
+
+def iter_folder(bucket, path: Optional[str] = None, page_size: int = LIST_PAGE_SIZE) -> Iterator[Dict]:
+    """
+    Stream every entry of one storage folder, page by page
+    
+    While the caller processes a page, the next one is already being
+    fetched on a helper thread (only when the current page came back full,
+    so a short folder costs exactly one request).
+    
+    Args:
+        bucket: Bucket API object (supabase.storage.from_(name))
+        path: Folder path inside the bucket (None = bucket root)
+    """
+    def fetch(offset: int):
+        return bucket.list(path, {'limit': page_size, 'offset': offset, 'sortBy': LIST_SORT})
+    
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        offset = 0
+        page = fetch(offset)
+        while True:
+            next_page = prefetcher.submit(fetch, offset + page_size) if len(page) >= page_size else None
+            yield from page
+            if next_page is None:
+                break
+            offset += page_size
+            page = next_page.result()
+
+
+class BlobStore:
+    """
+    Directory of object bodies addressed by SHA-256 (<root>/<2 hex>/<sha256>)
+    
+    Backup trees keep their browsable bucket layout, but each file there is
+    a hard link to its blob, so identical objects (across buckets, re-uploads
+    and backups) take disk space once. Blobs are made read-only, since every
+    backup linking to one would see an in-place edit.
+    """
+    
+    def __init__(self, root: str):
+        self.root = Path(root)
+    
+    def shares_filesystem(self, path: Path) -> bool:
+        """
+        True if the store (created if needed) is on the same filesystem as path
+        
+        Backup files can only hard-link to blobs on their own filesystem;
+        anywhere else every object would be stored twice.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        return os.stat(self.root).st_dev == os.stat(path).st_dev
+    
+    def blob_path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+    
+    def adopt(self, tmp_file: Path, digest: str, dest: Path) -> bool:
+        """
+        Move a downloaded temp file into the store (unless its blob already exists) and link dest to the blob
+        
+        Returns:
+            True if the blob was new
+        """
+        blob = self.blob_path(digest)
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        new = not blob.exists()
+        if new:
+            os.chmod(tmp_file, 0o444)
+            os.replace(tmp_file, blob)
+        else:
+            os.unlink(tmp_file)
+        
+        link_file(blob, dest)
+        return new
+    
+    def prune(self) -> Dict:
+        """
+        Delete blobs no backup links to any more (link count 1: only the store holds them)
+        
+        Returns:
+            Dict with 'kept', 'deleted' and 'freed_bytes'
+        """
+        kept = 0
+        deleted = 0
+        freed = 0
+        for path in self.root.glob('*/*'):
+            stat = path.stat()
+            if stat.st_nlink > 1:
+                kept += 1
+                continue
+            freed += stat.st_size
+            path.unlink()
+            deleted += 1
+        
+        return {'kept': kept, 'deleted': deleted, 'freed_bytes': freed}
+
+
+def link_file(source: Path, dest: Path):
+    """Hard-link source to dest, replacing dest if present; copies when they are on different filesystems"""
+    tmp_link = dest.parent / f".{dest.name}.link"
+    try:
+        if tmp_link.exists():
+            tmp_link.unlink()
+        os.link(source, tmp_link)
+        os.replace(tmp_link, dest)
+    except OSError:
+        if tmp_link.exists():
+            tmp_link.unlink()
+        shutil.copy2(source, dest)
+
+
+def load_object_manifest(storage_dir: Path) -> Optional[Dict]:
+    """objects.json of a storage backup folder, or None if it has none"""
+    manifest_file = Path(storage_dir) / OBJECT_MANIFEST
+    if not manifest_file.exists():
+        return None
+    with open(manifest_file, 'r') as f:
+        return json.load(f)
+
+
+def normalize_timestamp(value: Union[datetime, str, None]) -> Optional[str]:
+    """
+    One spelling for object timestamps: UTC, millisecond precision, 'Z' suffix
+    
+    The storage API returns '2024-01-02T03:04:05.123Z' while storage.objects
+    read over SQL gives datetimes ('...05.123000+00:00' once formatted), so
+    both listings go through here before they are stored or compared.
+    Unparseable strings are returned unchanged.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value)
+        except ValueError:
+            return value
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    value = value.astimezone(timezone.utc)
+    return value.strftime('%Y-%m-%dT%H:%M:%S.') + f"{value.microsecond // 1000:03d}Z"
+
+
+def object_unchanged(entry: Dict, previous: Optional[Dict]) -> bool:
+    """
+    True when two manifest entries describe the same object version
+    
+    Size must match, plus the etag and updated_at wherever both sides have
+    one; an entry with neither never counts as unchanged.
+    """
+    if not previous or entry.get('size') is None or entry.get('size') != previous.get('size'):
+        return False
+    
+    compared = False
+    for key, normalize in (('etag', str), ('updated_at', normalize_timestamp)):
+        if entry.get(key) is not None and previous.get(key) is not None:
+            # Older manifests may hold either timestamp spelling
+            if normalize(entry[key]) != normalize(previous[key]):
+                return False
+            compared = True
+    return compared
+
+
+def http_session() -> requests.Session:
+    """Keep-alive session of the calling thread (requests sessions are not shared across threads)"""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+
+def object_url(supabase_url: str, bucket_name: str, path: str) -> str:
+    """Storage API URL of one object (authenticated download)"""
+    return f"{supabase_url.rstrip('/')}/storage/v1/object/{quote(bucket_name)}/{quote(path)}"
+
+
+def stream_download(url: str, headers: Dict, dest: Path, buffer_size: int = DOWNLOAD_BUFFER_SIZE,
+                    store: Optional[BlobStore] = None) -> Dict:
+    """
+    Stream one object to dest without holding it in memory
+    
+    The body is written block by block to a temp file next to dest while
+    its SHA-256 is computed; the file is fsynced and renamed over dest only
+    once complete, so an interrupted download never leaves a truncated
+    object under its real name. With a blob store, the finished file becomes
+    (or is deduplicated against) the blob of its hash and dest is linked to it.
+    
+    Args:
+        url: Object URL (see object_url)
+        headers: Auth headers (apikey / Authorization)
+        dest: Final file path
+        buffer_size: Block size, which bounds memory per download
+        store: Blob store to put the object into (None = plain file at dest)
+    
+    Returns:
+        Dict with 'size', 'sha256' and 'new' (False when the blob store already had the content)
+    """
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=dest.parent, prefix=f".{dest.name}.", suffix='.part')
+    sha256 = hashlib.sha256()
+    size = 0
+    
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            with http_session().get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                response.raise_for_status()
+                expected = response.headers.get('Content-Length')
+                if response.headers.get('Content-Encoding'):
+                    expected = None
+                
+                for block in response.iter_content(chunk_size=buffer_size):
+                    f.write(block)
+                    sha256.update(block)
+                    size += len(block)
+            
+            if expected is not None and int(expected) != size:
+                raise Exception(f"Truncated download: got {size} of {expected} bytes")
+            
+            f.flush()
+            os.fsync(f.fileno())
+        
+        new = True
+        if store is not None:
+            new = store.adopt(Path(tmp_name), sha256.hexdigest(), dest)
+        else:
+            os.replace(tmp_name, dest)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+    
+    return {'size': size, 'sha256': sha256.hexdigest(), 'new': new}
+
+
+def is_transfer_temp(name: str) -> bool:
+    """Leftover temp file of an interrupted download or link (never an object of its own)"""
+    return name.startswith('.') and name.endswith(('.part', '.link'))
+
+
+def iter_local_files(root: Path) -> Iterator[tuple]:
+    """
+    Walk a local bucket folder with os.scandir (one stat per entry, no Path objects per level)
+    
+    Yields:
+        (object key relative to root with '/' separators, file path, size)
+    """
+    stack = [(str(root), "")]
+    while stack:
+        directory, prefix = stack.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, f"{prefix}{entry.name}/"))
+                elif entry.is_file() and not is_transfer_temp(entry.name):
+                    yield f"{prefix}{entry.name}", entry.path, entry.stat().st_size
+
+
+def stream_upload(url: str, headers: Dict, source: str, content_type: str, upsert: bool = True):
+    """
+    Upload one file from disk as the raw request body
+    
+    requests sends a file object in small blocks with its Content-Length
+    taken from the file, so the body is never held in memory.
+    """
+    upload_headers = dict(headers)
+    upload_headers['Content-Type'] = content_type
+    upload_headers['x-upsert'] = 'true' if upsert else 'false'
+    
+    with open(source, 'rb') as f:
+        response = http_session().post(url, headers=upload_headers, data=f, timeout=UPLOAD_TIMEOUT)
+    if response.status_code >= 400:
+        raise Exception(f"HTTP {response.status_code}: {response.text[:200]}")
+
+
+def head_object(url: str, headers: Dict) -> Optional[Dict]:
+    """
+    Size and ETag of a stored object, read with a HEAD request on its URL
+    
+    The storage API answers HEAD from the object body itself, so this also
+    confirms the body exists (a storage.objects row alone does not).
+    
+    Returns:
+        Dict with 'size' and 'etag', or None if the object cannot be served
+    """
+    try:
+        response = http_session().head(url, headers=headers, timeout=DOWNLOAD_TIMEOUT)
+    except requests.RequestException:
+        return None
+    if response.status_code != 200:
+        return None
+    
+    length = response.headers.get('Content-Length')
+    return {
+        'size': int(length) if length and length.isdigit() else None,
+        'etag': normalize_etag(response.headers.get('ETag'))
+    }
+
+
+def file_md5(path: str) -> str:
+    """Hex MD5 of a local file, the checksum storage reports as the ETag of a single-part upload"""
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(DOWNLOAD_BUFFER_SIZE), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def normalize_etag(etag: Optional[str]) -> Optional[str]:
+    """ETag without quotes or weak prefix, for comparing with file_md5()"""
+    if not etag:
+        return None
+    etag = etag.strip()
+    if etag.startswith('W/'):
+        etag = etag[2:]
+    return etag.strip('"').lower()
@@ -5,20 +5,93 @@ Handles backing up database, storage, and authentication data from Supabase
 
 import os
 import json
+import shutil
+import hashlib
 import subprocess
+import tempfile
+import multiprocessing
 from datetime import datetime
 from pathlib import Path
 from typing import Optional, Dict, List
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import psycopg2
 from supabase import create_client, Client
 from tqdm import tqdm
+from tabulate import tabulate
 import requests
+from table_export import (
+    COMPRESSION_SUFFIXES, open_compressor, list_tables_by_size, export_table_json, export_table_copy,
+    export_table_worker, init_export_worker, connect_at_snapshot, begin_snapshot, plan_table_parts,
+    write_part_manifest, table_change_stats, stats_epoch, table_file_name, CHANGE_COUNTERS, integer_primary_key, table_columns,
+    table_column_lists, delta_chunk_hashes, delta_chunk_where
+)
+from chunk_store import ChunkStore, CHUNK_MANIFEST, load_chunk_manifest
+from schema_fingerprint import schema_fingerprint, changed_components
+from task_graph import TaskGraph
+from storage_transfer import (
+    WorkPool, TransferProgress, format_transfer_stats, iter_folder, object_url, stream_download,
+    link_file, load_object_manifest, object_unchanged, normalize_timestamp, BlobStore,
+    DOWNLOAD_BUFFER_SIZE, OBJECT_MANIFEST
+)
+
+# Read size when piping pg_dump output to disk
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# pg_dump sections of a sectioned plain dump, in restore order
+DUMP_SECTIONS = ('pre-data', 'data', 'post-data')
+
+# Rows fetched per round-trip when listing storage.objects
+STORAGE_LIST_ITERSIZE = 5000
+
+# Files each backup component writes, relative to the backup folder (for the size summary)
+COMPONENT_OUTPUTS = {
+    'database': ('database*', 'tables_json', 'tables_copy'),
+    'roles': ('roles*',),
+    'project_config': ('project_config.json', 'config_error.txt'),
+    'webhooks': ('webhooks*',),
+    'realtime': ('realtime*',),
+    'storage': ('storage',),
+    'auth': ('auth_users.json',),
+    'edge_functions': ('edge_functions',),
+}
+
+
+def _format_size(size: int) -> str:
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f} KB"
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+class _HashingWriter:
+    """File-like sink that hashes and counts bytes on their way to disk"""
+    
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+        self.bytes_written = 0
+    
+    def write(self, data) -> int:
+        self.sha256.update(data)
+        self.bytes_written += len(data)
+        return self.fileobj.write(data)
+    
+    def flush(self):
+        self.fileobj.flush()
 
 
 class SupabaseBackup:
     """Class to handle Supabase backups"""
     
-    def __init__(self, supabase_url: str, supabase_key: str, db_url: str, backup_dir: str = "./backups", project_name: str = None):
+    def __init__(self, supabase_url: str, supabase_key: str, db_url: str, backup_dir: str = "./backups", project_name: str = None,
+                 jobs: int = 1, compression: Optional[str] = None, json_format: str = 'json', itersize: int = 2000,
+                 table_workers: int = 1, consistent_snapshot: bool = True, chunk_rows: int = 1_000_000,
+                 copy_format: Optional[str] = None, base_backup: Optional[str] = None,
+                 delta_tables: Optional[List[str]] = None, delta_chunk_keys: int = 100_000,
+                 dedup: bool = False, chunk_store: Optional[str] = None, reuse_schema: bool = False,
+                 component_workers: int = 4, storage_workers: int = 8,
+                 download_buffer: int = DOWNLOAD_BUFFER_SIZE, storage_blobs: bool = False,
+                 blob_store: Optional[str] = None):
         """
         Initialize the backup handler
         
@@ -28,12 +101,72 @@ class SupabaseBackup:
             db_url: PostgreSQL database connection URL
             backup_dir: Directory to store backups
             project_name: Optional project name to prefix backup files (e.g., 'ipa')
+            jobs: Number of parallel pg_dump jobs (> 1 produces a directory-format dump)
+            compression: Stream plain SQL dumps through 'gzip' or 'zstd' while writing (None = uncompressed)
+            json_format: Table export format - 'json' (streamed JSON array) or 'ndjson' (one row per line)
+            itersize: Rows fetched per round-trip from the server-side cursor during table export
+            table_workers: Worker processes (one connection each) exporting tables in parallel
+            chunk_rows: With table_workers > 1, tables estimated above this many rows are split into
+                        key/ctid ranges exported concurrently as numbered part files (0 = never split)
+            copy_format: Export tables with COPY ... TO STDOUT in 'text' or 'binary' format into
+                         tables_copy/ (compressed with `compression`, gzip by default) instead of JSON
+            base_backup: Path of a previous backup; tables whose change counters match it are
+                         hard-linked from there instead of being re-exported
+            delta_tables: Tables (single integer primary key) exported in delta mode: rows are hashed
+                          in primary-key chunks and only chunks that differ from base_backup are written
+            delta_chunk_keys: Width of a delta chunk, in primary-key values
+            dedup: Move the finished backup into a content-defined chunk store, leaving
+                   metadata.json and a chunks.json manifest of chunk references
+            chunk_store: Chunk store directory (default: <backup_dir>/.chunks)
+            reuse_schema: Write plain dumps as pre-data / data / post-data sections and, when the
+                          schema fingerprint matches base_backup, link its schema sections and
+                          only dump data
+            component_workers: Backup components (database, storage, auth, ...) run concurrently,
+                               at most this many at a time (1 = one after another)
+            storage_workers: Concurrent storage listings/downloads
+            download_buffer: Bytes buffered per storage download (objects are streamed to disk)
+            storage_blobs: Store each downloaded object once in a content-addressed blob store and
+                           hard-link it into the backup's bucket folders
+            blob_store: Blob store directory (default: <backup_dir>/.blobs)
+            consistent_snapshot: Export one database snapshot and read every database component
+                                 (pg_dump, table export, roles, config, webhooks, realtime) through it
         """
         self.supabase_url = supabase_url
         self.supabase_key = supabase_key
         self.db_url = db_url
         self.backup_dir = Path(backup_dir)
         self.project_name = project_name or os.getenv('PROJECT_NAME', '')
+        self.jobs = max(1, jobs)
+        
+        if compression and compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unsupported compression: {compression} (choose from {', '.join(COMPRESSION_SUFFIXES)})")
+        self.compression = compression
+        
+        if json_format not in ('json', 'ndjson'):
+            raise ValueError(f"Unsupported JSON export format: {json_format} (choose from json, ndjson)")
+        self.json_format = json_format
+        self.itersize = max(1, itersize)
+        self.table_workers = max(1, table_workers)
+        self.consistent_snapshot = consistent_snapshot
+        self.chunk_rows = max(0, chunk_rows)
+        
+        if copy_format and copy_format not in ('text', 'binary'):
+            raise ValueError(f"Unsupported COPY format: {copy_format} (choose from text, binary)")
+        self.copy_format = copy_format
+        self.base_backup = Path(base_backup) if base_backup else None
+        self.delta_tables = set(delta_tables or [])
+        self.delta_chunk_keys = max(1, delta_chunk_keys)
+        self.dedup = dedup
+        self.chunk_store = ChunkStore(chunk_store or Path(backup_dir) / ".chunks")
+        self.reuse_schema = reuse_schema
+        self.component_workers = max(1, component_workers)
+        self.storage_workers = max(1, storage_workers)
+        self.download_buffer = max(4096, download_buffer)
+        self.storage_blobs = storage_blobs
+        self.blob_store = BlobStore(blob_store or Path(backup_dir) / ".blobs")
+        self.snapshot_id: Optional[str] = None
+        self._snapshot_conn = None
+        self._snapshot_stats: Optional[Dict] = None
         self.supabase: Client = create_client(supabase_url, supabase_key)
         
         # Create backup directory if it doesn't exist
@@ -75,123 +208,810 @@ class SupabaseBackup:
         
         print(f"Creating backup at: {backup_path}")
         
-        # Backup database schema and data
-        print("\n📊 Backing up database...")
-        self._backup_database(backup_path)
+        # Pin every database read of this backup to a single exported snapshot
+        snapshot_info = None
+        if self.consistent_snapshot:
+            print("\n📸 Exporting database snapshot...")
+            snapshot_info = self._export_snapshot()
         
-        # Backup storage files
+        # (name, banner, method, reads the database, retries); database components are added
+        # first so they start first, and API-bound ones retry since re-running them just
+        # rewrites their own files
+        components = [
+            ('database', "📊 Backing up database...", self._backup_database, True, 0),
+            ('roles', "👥 Backing up database roles...", self._backup_database_roles, True, 0),
+            ('project_config', "⚙️  Backing up project configuration...", self._backup_project_config, True, 0),
+            ('webhooks', "🔗 Backing up webhooks...", self._backup_webhooks, True, 0),
+            ('realtime', "📡 Backing up realtime configuration...", self._backup_realtime_config, True, 0),
+        ]
         if include_storage:
-            print("\n📁 Backing up storage files...")
-            self._backup_storage(backup_path)
-        
-        # Backup auth users
+            components.append(('storage', "📁 Backing up storage files...", self._backup_storage, False, 1))
         if include_auth:
-            print("\n👤 Backing up auth users...")
-            self._backup_auth(backup_path)
-        
-        # Backup edge functions
+            components.append(('auth', "👤 Backing up auth users...", self._backup_auth, False, 1))
         if include_edge_functions:
-            print("\n⚡ Backing up edge functions...")
-            self._backup_edge_functions(backup_path)
+            components.append(('edge_functions', "⚡ Backing up edge functions...", self._backup_edge_functions,
+                               False, 1))
         
-        # Backup database roles
-        print("\n👥 Backing up database roles...")
-        self._backup_database_roles(backup_path)
+        graph = TaskGraph()
+        for name, banner, method, _, retries in components:
+            graph.add(name, partial(self._run_component, banner, method, backup_path), retries=retries)
+        # Database components are done; don't hold back vacuum during the API-bound steps
+        graph.add('release_snapshot', self._release_snapshot,
+                  deps=[name for name, _, _, uses_database, _ in components if uses_database], always=True)
+        
+        print(f"\n🚀 Running {len(components)} components with up to {self.component_workers} at a time")
+        try:
+            graph.run(self.component_workers)
+        finally:
+            self._release_snapshot()
         
-        # Backup project configuration
-        print("\n⚙️  Backing up project configuration...")
-        self._backup_project_config(backup_path)
+        component_results = {
+            name: self._component_result(name, graph.results[name], backup_path) for name, *_ in components
+        }
+        self._print_component_summary(component_results)
+        print(graph.timing_report())
         
-        # Backup webhooks
-        print("\n🔗 Backing up webhooks...")
-        self._backup_webhooks(backup_path)
+        database = component_results['database']
+        if database['status'] != 'ok':
+            raise Exception(f"Database backup failed: {database['error']}")
+        database_info = database.pop('result')
+        for result in component_results.values():
+            result.pop('result', None)
         
-        # Backup realtime configuration
-        print("\n📡 Backing up realtime configuration...")
-        self._backup_realtime_config(backup_path)
+        # Replace the backup's files with chunk references (metadata.json stays readable)
+        chunk_info = None
+        if self.dedup:
+            print("\n🧩 Deduplicating into chunk store...")
+            chunk_info = self._pack_backup(backup_path)
         
         # Create metadata file
-        self._create_metadata(backup_path, include_storage, include_auth, include_edge_functions)
+        self._create_metadata(backup_path, include_storage, include_auth, include_edge_functions,
+                              database_info=database_info, snapshot_info=snapshot_info, chunk_info=chunk_info,
+                              component_info=component_results)
         
         print(f"\n✅ Backup completed successfully at: {backup_path}")
         return str(backup_path)
     
-    def _backup_database(self, backup_path: Path):
-        """Backup database using pg_dump"""
-        dump_file = backup_path / "database.sql"
+    def _run_component(self, banner: str, method, backup_path: Path):
+        """Task body of one backup component: print its banner and run it"""
+        print(f"\n{banner}")
+        return method(backup_path)
+    
+    def _component_result(self, name: str, task: Dict, backup_path: Path) -> Dict:
+        """
+        Summarize one component's task result with the size of its output
+        
+        Components that handle their own errors by writing <name>_error.txt are
+        reported as 'partial'.
+        
+        Returns:
+            Dict with 'status' ('ok', 'partial', 'failed' or 'skipped'), 'attempts', 'seconds',
+            'bytes', 'error' and the component's return value under 'result'
+        """
+        status, error = task['status'], task['error']
+        if status == 'ok':
+            error_files = [
+                path.name for pattern in COMPONENT_OUTPUTS.get(name, ())
+                for path in backup_path.glob(pattern) if path.name.endswith('_error.txt')
+            ]
+            if error_files:
+                status, error = 'partial', f"see {', '.join(error_files)}"
+        
+        return {
+            'status': status,
+            'attempts': task['attempts'],
+            'seconds': task['seconds'],
+            'bytes': self._component_bytes(backup_path, name),
+            'error': error,
+            'result': task['result']
+        }
+    
+    def _component_bytes(self, backup_path: Path, name: str) -> int:
+        """Bytes on disk written by one component (files matching its COMPONENT_OUTPUTS patterns)"""
+        total = 0
+        for pattern in COMPONENT_OUTPUTS.get(name, ()):
+            for path in backup_path.glob(pattern):
+                if path.is_file():
+                    total += path.stat().st_size
+                elif path.is_dir():
+                    total += sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+        return total
+    
+    def _print_component_summary(self, component_results: Dict[str, Dict]):
+        """Per-component status, duration and size"""
+        rows = [
+            [name, {'ok': '✓', 'partial': '⚠'}.get(result['status'], '✗'), f"{result['seconds']:.1f}s",
+             _format_size(result['bytes']), result['error'] or '']
+            for name, result in component_results.items()
+        ]
+        print("\n📋 Component summary:")
+        print(tabulate(rows, headers=['Component', 'Status', 'Duration', 'Size', 'Error'], tablefmt='simple'))
+    
+    def _export_snapshot(self) -> Optional[Dict]:
+        """
+        Open the coordinator transaction and export its snapshot
+        
+        The coordinator connection stays open (and idle in transaction) until
+        _release_snapshot(), which is what keeps the snapshot importable by
+        pg_dump and the export workers.
         
+        The table change counters are read on the same connection just before
+        the snapshot is taken: they are not MVCC, and read any later they could
+        count writes that the snapshot (and so the export) does not contain.
+        
+        Returns:
+            Snapshot description for metadata.json, or None if no snapshot could be exported
+        """
         try:
-            # Use pg_dump to create a full database backup
-            cmd = f"pg_dump {self.db_url} -f {dump_file} --no-owner --no-acl"
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+            conn = psycopg2.connect(self.db_url)
+            try:
+                change_stats = {'epoch': stats_epoch(conn), 'tables': table_change_stats(conn)}
+                conn.commit()
+            except psycopg2.Error as e:
+                conn.rollback()
+                print(f"  ⚠ Warning: Could not read table change counters, no table will be carried forward: {e}")
+                change_stats = None
             
-            if result.returncode != 0:
-                raise Exception(f"pg_dump failed: {result.stderr}")
+            conn.set_session(isolation_level=psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ, readonly=True)
+            cursor = conn.cursor()
+            cursor.execute("SELECT pg_export_snapshot(), now()")
+            snapshot_id, taken_at = cursor.fetchone()
+            cursor.close()
+        except Exception as e:
+            print(f"  ⚠ Warning: Could not export a snapshot, components will be read at different instants: {e}")
+            return None
+        
+        self._snapshot_conn = conn
+        self.snapshot_id = snapshot_id
+        self._snapshot_stats = change_stats
+        print(f"  ✓ Snapshot {snapshot_id} exported")
+        
+        return {
+            'id': snapshot_id,
+            'taken_at': taken_at.isoformat()
+        }
+    
+    def _release_snapshot(self):
+        """End the coordinator transaction; the snapshot is no longer importable afterwards"""
+        if self._snapshot_conn is not None:
+            try:
+                self._snapshot_conn.rollback()
+                self._snapshot_conn.close()
+            except Exception:
+                pass
+        self._snapshot_conn = None
+        self.snapshot_id = None
+        self._snapshot_stats = None
+    
+    def _connect(self):
+        """Open a database connection, reading through the exported snapshot when there is one"""
+        return connect_at_snapshot(self.db_url, self.snapshot_id)
+    
+    def _backup_database(self, backup_path: Path) -> Dict:
+        """
+        Backup database using pg_dump
+        
+        Returns:
+            Dump description for metadata.json (format, path relative to the backup, jobs,
+            and for streamed plain dumps: compression, sha256 and byte counts)
+        """
+        if self.jobs > 1:
+            # Directory format: one file per table, written (and gzip-compressed) by parallel pg_dump workers
+            dump_format = 'directory'
+            dump_file = backup_path / "database"
+            if self.reuse_schema:
+                print("  ⚠ Warning: reuse_schema is ignored with jobs > 1 (directory dumps have no sections)")
+            if self.compression:
+                print(f"  ⚠ Warning: compression '{self.compression}' is ignored with jobs > 1 "
+                      f"(pg_dump compresses directory dumps with gzip itself)")
+        elif self.reuse_schema:
+            dump_format = 'sections'
+            dump_file = backup_path / f"database.data.sql{COMPRESSION_SUFFIXES.get(self.compression, '')}"
+        else:
+            dump_format = 'plain'
+            dump_file = backup_path / f"database.sql{COMPRESSION_SUFFIXES.get(self.compression, '')}"
+        
+        # Catalog-only fingerprint, recorded so later backups (and `schema-changed`) can compare
+        schema = self._schema_fingerprint()
+        
+        try:
+            # Use pg_dump to create a full database backup
+            snapshot_arg = f" --snapshot={self.snapshot_id}" if self.snapshot_id else ""
+            if dump_format == 'sections':
+                dump_info = {'sections': self._dump_sections(backup_path, snapshot_arg, schema)}
+            elif dump_format == 'directory':
+                cmd = f"pg_dump {self.db_url} -Fd -j {self.jobs} -f {dump_file} --no-owner --no-acl{snapshot_arg}"
+                result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+                
+                if result.returncode != 0:
+                    raise Exception(f"pg_dump failed: {result.stderr}")
+                
+                dump_info = {}
+            else:
+                cmd = f"pg_dump {self.db_url} --no-owner --no-acl{snapshot_arg}"
+                dump_info = self._stream_pg_dump(cmd, dump_file)
             
             print(f"  ✓ Database dumped to {dump_file}")
+            if 'sha256' in dump_info:
+                ratio = dump_info['bytes'] / dump_info['uncompressed_bytes'] if dump_info['uncompressed_bytes'] else 1
+                print(f"    {dump_info['uncompressed_bytes'] / (1024 * 1024):.1f} MB dumped, "
+                      f"{dump_info['bytes'] / (1024 * 1024):.1f} MB on disk ({ratio:.0%}), sha256 {dump_info['sha256'][:12]}…")
             
             # Also backup table data as JSON for easier inspection
-            self._backup_tables_as_json(backup_path)
+            table_export = self._backup_tables_as_json(backup_path)
+            
+            return {
+                'format': dump_format,
+                'path': dump_file.name,
+                'jobs': self.jobs,
+                **dump_info,
+                'schema': schema,
+                'table_export': table_export
+            }
             
         except Exception as e:
             print(f"  ✗ Database backup failed: {e}")
             raise
     
-    def _backup_tables_as_json(self, backup_path: Path):
-        """Backup individual tables as JSON files"""
-        json_dir = backup_path / "tables_json"
-        json_dir.mkdir(exist_ok=True)
+    def _schema_fingerprint(self) -> Optional[Dict]:
+        """Schema fingerprint read through the snapshot, or None if the catalog queries fail"""
+        try:
+            conn = self._connect()
+            try:
+                return schema_fingerprint(conn)
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"  ⚠ Warning: Could not fingerprint schema: {e}")
+            return None
+    
+    def _dump_sections(self, backup_path: Path, snapshot_arg: str, schema: Optional[Dict]) -> Dict[str, Dict]:
+        """
+        Dump the database as three plain SQL files: pre-data, data and post-data
+        
+        When the schema fingerprint matches the base backup's, the pre-data and
+        post-data files are hard-linked from the base and only the data section
+        is dumped.
+        
+        Returns:
+            Per-section file info (path, compression, sha256, byte counts, 'reused_from')
+        """
+        suffix = COMPRESSION_SUFFIXES.get(self.compression, '')
+        base_sections = self._reusable_schema_sections(schema)
+        
+        sections = {}
+        for section in DUMP_SECTIONS:
+            section_file = backup_path / f"database.{section}.sql{suffix}"
+            
+            base_section = base_sections.get(section)
+            if base_section:
+                link_file(self.base_backup / base_section['path'], section_file)
+                sections[section] = {**base_section, 'path': section_file.name, 'reused_from': self.base_backup.name}
+                continue
+            
+            cmd = f"pg_dump {self.db_url} --section={section} --no-owner --no-acl{snapshot_arg}"
+            sections[section] = {
+                'path': section_file.name,
+                **self._stream_pg_dump(cmd, section_file),
+                'reused_from': None
+            }
+        
+        if base_sections:
+            print(f"  ♻️  Schema unchanged since {self.base_backup.name}, reused its pre-data and post-data sections")
+        
+        return sections
+    
+    def _reusable_schema_sections(self, schema: Optional[Dict]) -> Dict[str, Dict]:
+        """Pre-data / post-data sections of the base backup, if its schema fingerprint matches"""
+        if not self.base_backup or not schema:
+            return {}
         
         try:
-            conn = psycopg2.connect(self.db_url)
-            cursor = conn.cursor()
+            with open(self.base_backup / "metadata.json", 'r') as f:
+                base_database = json.load(f).get('database') or {}
+        except Exception as e:
+            print(f"  ⚠ Warning: Could not read base backup {self.base_backup}, dumping schema: {e}")
+            return {}
+        
+        base_sections = base_database.get('sections') or {}
+        if base_database.get('format') != 'sections' or not base_database.get('schema'):
+            return {}
+        
+        changed = changed_components(schema, base_database['schema'])
+        if changed:
+            print(f"  ℹ️  Schema changed since {self.base_backup.name} ({', '.join(changed)}), dumping schema")
+            return {}
+        
+        reusable = {
+            section: base_sections[section] for section in ('pre-data', 'post-data')
+            if section in base_sections
+            and base_sections[section].get('compression') == self.compression
+            and (self.base_backup / base_sections[section]['path']).exists()
+        }
+        return reusable if len(reusable) == 2 else {}
+    
+    def _stream_pg_dump(self, cmd: str, dump_file: Path) -> Dict:
+        """
+        Pipe pg_dump stdout through the compressor straight to disk
+        
+        The SHA-256 of the written file and the raw/on-disk byte counts are
+        computed on the same pass, so the dump is never re-read.
+        """
+        uncompressed_bytes = 0
+        
+        # stderr goes to a temp file so a chatty pg_dump can never block on a full pipe
+        with tempfile.TemporaryFile() as stderr_file, open(dump_file, 'wb') as f:
+            sink = _HashingWriter(f)
+            compressor = open_compressor(sink, self.compression)
+            out = compressor or sink
             
-            # Get all tables in public schema
-            cursor.execute("""
-                SELECT table_name 
-                FROM information_schema.tables 
-                WHERE table_schema = 'public' 
-                AND table_type = 'BASE TABLE'
-            """)
+            proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=stderr_file)
+            try:
+                while True:
+                    chunk = proc.stdout.read(STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    uncompressed_bytes += len(chunk)
+                    out.write(chunk)
+            finally:
+                proc.stdout.close()
+                returncode = proc.wait()
+            
+            if compressor is not None:
+                compressor.close()
+            sink.flush()
+            
+            if returncode != 0:
+                stderr_file.seek(0)
+                raise Exception(f"pg_dump failed: {stderr_file.read().decode(errors='replace')}")
+        
+        return {
+            'compression': self.compression,
+            'sha256': sink.sha256.hexdigest(),
+            'bytes': sink.bytes_written,
+            'uncompressed_bytes': uncompressed_bytes
+        }
+    
+    def _backup_tables_as_json(self, backup_path: Path) -> Optional[Dict]:
+        """
+        Backup individual tables as JSON files (or COPY files with copy_format)
+        
+        Returns:
+            Table export description for metadata.json: directory, format, compression,
+            base backup and per-table change counters / row counts
+        """
+        if self.copy_format:
+            out_dir = backup_path / "tables_copy"
+            label = f"COPY {self.copy_format}"
+        else:
+            out_dir = backup_path / "tables_json"
+            label = self.json_format.upper()
+        out_dir.mkdir(exist_ok=True)
+        
+        try:
+            conn = self._connect()
             
-            tables = cursor.fetchall()
+            # Get all tables in public schema, largest first so the long tail overlaps the big ones
+            table_sizes = list_tables_by_size(conn)
             
-            for (table_name,) in tqdm(tables, desc="  Exporting tables"):
+            # Tables untouched since the base backup are carried forward instead of re-exported. Counters
+            # come from before the snapshot; without one, from before any row is read
+            if self.snapshot_id:
+                snapshot_stats = self._snapshot_stats or {}
+                epoch, stats = snapshot_stats.get('epoch'), snapshot_stats.get('tables', {})
+            else:
+                epoch, stats = stats_epoch(conn), table_change_stats(conn)
+            # Read on the export's own snapshot, so they are the columns the export will have
+            columns = table_column_lists(conn)
+            base_export = self._load_base_table_export()
+            reused = self._carry_forward_tables(out_dir, stats, base_export, epoch, columns)
+            table_sizes = [t for t in table_sizes if t[0] not in reused]
+            
+            # Delta tables only write the primary-key chunks that changed since the base
+            deltas = {}
+            for table_name in [t[0] for t in table_sizes if t[0] in self.delta_tables]:
                 try:
-                    cursor.execute(f'SELECT * FROM "{table_name}"')
-                    columns = [desc[0] for desc in cursor.description]
-                    rows = cursor.fetchall()
-                    
-                    # Convert to list of dicts
-                    data = [dict(zip(columns, row)) for row in rows]
-                    
-                    # Convert non-serializable types
-                    for item in data:
-                        for key, value in item.items():
-                            if isinstance(value, (datetime,)):
-                                item[key] = value.isoformat()
-                            elif not isinstance(value, (str, int, float, bool, type(None), list, dict)):
-                                item[key] = str(value)
-                    
-                    # Save to JSON
-                    with open(json_dir / f"{table_name}.json", 'w') as f:
-                        json.dump(data, f, indent=2, default=str)
-                        
+                    result = self._backup_delta_table(conn, out_dir, table_name, stats, base_export, epoch)
                 except Exception as e:
-                    print(f"    ⚠ Warning: Could not export table {table_name}: {e}")
+                    conn.rollback()
+                    if self.snapshot_id:
+                        begin_snapshot(conn, self.snapshot_id)
+                    print(f"    ⚠ Warning: Delta export of {table_name} failed, exporting whole: {e}")
+                    result = None
+                if result:
+                    deltas[table_name] = result
+            table_sizes = [t for t in table_sizes if t[0] not in deltas]
+            tables = [name for name, _, _ in table_sizes]
+            results = {}
             
-            cursor.close()
-            conn.close()
-            print(f"  ✓ Tables exported to JSON in {json_dir}")
+            if self.table_workers > 1 and len(tables) > 0:
+                # Split the biggest tables so no single table leaves one worker running alone
+                plans = {}
+                if self.chunk_rows:
+                    for table_name, estimated_rows, _ in table_sizes:
+                        if estimated_rows > self.chunk_rows:
+                            try:
+                                plan = plan_table_parts(conn, table_name, estimated_rows, self.chunk_rows)
+                            except Exception as e:
+                                conn.rollback()
+                                if self.snapshot_id:
+                                    begin_snapshot(conn, self.snapshot_id)
+                                print(f"    ⚠ Warning: Could not split table {table_name}, exporting whole: {e}")
+                                plan = None
+                            if plan:
+                                plans[table_name] = plan
+                conn.close()
+                results = self._export_tables_parallel(tables, out_dir, plans)
+            else:
+                for table_name in tqdm(tables, desc="  Exporting tables"):
+                    try:
+                        if self.copy_format:
+                            results[table_name] = export_table_copy(conn, table_name, out_dir, self.copy_format,
+                                                                    self._copy_compression())
+                        else:
+                            results[table_name] = {
+                                'rows': export_table_json(conn, table_name, out_dir, self.json_format, self.itersize)
+                            }
+                        if not self.snapshot_id:
+                            conn.commit()
+                    except Exception as e:
+                        # Clear the aborted transaction (re-importing the snapshot) so the next table can be exported
+                        conn.rollback()
+                        if self.snapshot_id:
+                            begin_snapshot(conn, self.snapshot_id)
+                        print(f"    ⚠ Warning: Could not export table {table_name}: {e}")
+                conn.close()
+            
+            results.update(reused)
+            results.update(deltas)
+            
+            if self.copy_format:
+                self._write_copy_manifest(out_dir, results)
+            
+            print(f"  ✓ Tables exported to {label} in {out_dir}")
+            
+            return {
+                'directory': out_dir.name,
+                'format': self.copy_format or self.json_format,
+                'compression': self._copy_compression() if self.copy_format else None,
+                'base': self.base_backup.name if self.base_backup else None,
+                'stats_epoch': epoch,
+                'tables': {
+                    name: {
+                        **stats.get(name, {}),
+                        'columns': columns.get(name),
+                        'rows': result.get('rows'),
+                        'reused': name in reused,
+                        'delta': name in deltas
+                    }
+                    for name, result in results.items()
+                }
+            }
             
         except Exception as e:
-            print(f"  ⚠ Warning: JSON export failed: {e}")
+            print(f"  ⚠ Warning: Table export ({label}) failed: {e}")
+            return None
+    
+    def _load_base_table_export(self) -> Optional[Dict]:
+        """
+        Table export description of the base backup, if it can be built upon
+        
+        Returns:
+            The base's metadata 'table_export' entry, or None when there is no base
+            or it was exported with a different format or compression
+        """
+        if not self.base_backup:
+            return None
+        
+        table_format = self.copy_format or self.json_format
+        compression = self._copy_compression() if self.copy_format else None
+        
+        try:
+            with open(self.base_backup / "metadata.json", 'r') as f:
+                base_export = json.load(f).get('database', {}).get('table_export')
+        except Exception as e:
+            print(f"  ⚠ Warning: Could not read base backup {self.base_backup}, exporting all tables: {e}")
+            return None
+        
+        if not base_export or base_export.get('format') != table_format or base_export.get('compression') != compression:
+            print(f"  ℹ️  Base backup {self.base_backup.name} has no matching table export, exporting all tables")
+            return None
+        
+        if load_chunk_manifest(self.base_backup) is not None:
+            print(f"  ℹ️  Base backup {self.base_backup.name} is packed in a chunk store, exporting all tables "
+                  f"(unchanged data is deduplicated there instead)")
+            return None
+        
+        return base_export
+    
+    def _carry_forward_tables(self, out_dir: Path, stats: Dict[str, Dict],
+                              base_export: Optional[Dict], epoch: Optional[str] = None,
+                              columns: Optional[Dict[str, List[str]]] = None) -> Dict[str, Dict]:
+        """
+        Hard-link the exports of unchanged tables from the base backup
+        
+        A table is reused only if the base was exported with the same format
+        and compression, its counters come from the same statistics epoch,
+        every change counter matches and it still has the base's columns.
+        Delta tables are left to _backup_delta_table.
+        
+        Returns:
+            Dict of reused table name -> export result (as the exporters return it)
+        """
+        if not base_export:
+            return {}
+        
+        if not epoch or base_export.get('stats_epoch') != epoch:
+            print(f"  ℹ️  Change counters of {self.base_backup.name} are not comparable (statistics reset, "
+                  f"server restart or older backup), exporting all tables")
+            return {}
+        
+        table_format = self.copy_format or self.json_format
+        compression = self._copy_compression() if self.copy_format else None
+        base_dir = self.base_backup / base_export['directory']
+        base_copy_tables = {}
+        if self.copy_format:
+            with open(base_dir / "manifest.json", 'r') as f:
+                base_copy_tables = json.load(f).get('tables', {})
+        
+        reused = {}
+        for table_name, current in stats.items():
+            previous = base_export.get('tables', {}).get(table_name)
+            if not previous or previous.get('rows') is None or previous.get('delta'):
+                continue
+            if table_name in self.delta_tables:
+                continue
+            if any(previous.get(counter) != current[counter] for counter in CHANGE_COUNTERS):
+                continue
+            if not previous.get('columns') or previous['columns'] != (columns or {}).get(table_name):
+                continue
+            if self.copy_format and table_name not in base_copy_tables:
+                continue
+            
+            try:
+                if not self._link_table_files(base_dir, out_dir, table_name, table_format, compression):
+                    continue
+            except OSError as e:
+                print(f"    ⚠ Warning: Could not reuse {table_name} from base backup: {e}")
+                continue
+            
+            reused[table_name] = base_copy_tables.get(table_name) or {'rows': previous['rows']}
+        
+        print(f"  ♻️  Reusing {len(reused)} unchanged table(s) from {self.base_backup.name}")
+        return reused
+    
+    def _backup_delta_table(self, conn, out_dir: Path, table_name: str, stats: Dict[str, Dict],
+                            base_export: Optional[Dict], epoch: Optional[str] = None) -> Optional[Dict]:
+        """
+        Export a table in delta mode: only the primary-key chunks that changed since the base
+        
+        Rows are hashed per chunk of `delta_chunk_keys` key values on the server and
+        compared with the chunk hashes in the base backup's <table>/delta.json.
+        Unchanged chunks are not copied; the manifest points at the backup that
+        holds them ('source', relative to this backup), so a restore walks the chain.
+        If the change counters match the base, the scan is skipped entirely; that
+        relies on `stats` having been read before the snapshot (see _export_snapshot)
+        and in the same statistics epoch as the base, otherwise every chunk is hashed.
+        
+        Run with the consistent snapshot so hashes and chunk files agree.
+        
+        Returns:
+            Export result ({'rows', 'delta'}), or None if the table cannot be exported as a delta
+        """
+        key = integer_primary_key(conn, table_name)
+        if not key:
+            print(f"    ⚠ Warning: {table_name} has no single integer primary key, exporting whole")
+            return None
+        
+        table_format = self.copy_format or self.json_format
+        compression = self._copy_compression() if self.copy_format else None
+        backup_path = out_dir.parent
+        columns = table_columns(conn, table_name)
+        
+        # Chunks of the base, with their sources rebased onto this backup
+        base_chunks = {}
+        if base_export:
+            base_delta = self.base_backup / base_export['directory'] / table_name / "delta.json"
+            if base_delta.exists():
+                with open(base_delta, 'r') as f:
+                    base_manifest = json.load(f)
+                if (base_manifest.get('key') == key and base_manifest.get('columns') == columns
+                        and base_manifest.get('chunk_keys') == self.delta_chunk_keys):
+                    for chunk, info in base_manifest.get('chunks', {}).items():
+                        source = os.path.relpath(self.base_backup / info.get('source', '.'), backup_path)
+                        base_chunks[int(chunk)] = {**info, 'source': source}
+        
+        previous = (base_export or {}).get('tables', {}).get(table_name) or {}
+        current = stats.get(table_name)
+        same_epoch = epoch is not None and (base_export or {}).get('stats_epoch') == epoch
+        unchanged = bool(base_chunks) and current is not None and previous.get('delta') and same_epoch and all(
+            previous.get(counter) == current[counter] for counter in CHANGE_COUNTERS
+        )
+        
+        if unchanged:
+            chunks = base_chunks
+        else:
+            chunks = {}
+            hashes = delta_chunk_hashes(conn, table_name, key, self.delta_chunk_keys)
+            for chunk, chunk_hash in sorted(hashes.items()):
+                base_chunk = base_chunks.get(chunk)
+                if base_chunk and base_chunk['hash'] == chunk_hash['hash']:
+                    chunks[chunk] = base_chunk
+                    continue
+                
+                where = delta_chunk_where(key, chunk, self.delta_chunk_keys)
+                if self.copy_format:
+                    result = export_table_copy(conn, table_name, out_dir, self.copy_format, compression, where, chunk)
+                    file_name, rows = result['file'], result['rows']
+                else:
+                    rows = export_table_json(conn, table_name, out_dir, self.json_format, self.itersize, where, chunk)
+                    file_name = table_file_name(table_name, table_format, part=chunk)
+                chunks[chunk] = {'hash': chunk_hash['hash'], 'rows': rows, 'file': file_name, 'source': '.'}
+            
+            if not self.snapshot_id:
+                conn.commit()
+        
+        exported = sum(1 for info in chunks.values() if info['source'] == '.')
+        manifest = {
+            'table': table_name,
+            'format': table_format,
+            'compression': compression,
+            'columns': columns,
+            'key': key,
+            'chunk_keys': self.delta_chunk_keys,
+            'parent': self.base_backup.name if base_chunks else None,
+            'rows': sum(info['rows'] or 0 for info in chunks.values()),
+            'exported_chunks': exported,
+            'deleted_chunks': sorted(set(base_chunks) - set(chunks)),
+            'chunks': {str(chunk): info for chunk, info in sorted(chunks.items())}
+        }
+        
+        (out_dir / table_name).mkdir(exist_ok=True)
+        with open(out_dir / table_name / "delta.json", 'w') as f:
+            json.dump(manifest, f, indent=2)
+        
+        print(f"    Δ {table_name}: {exported} of {len(chunks)} chunks changed since "
+              f"{manifest['parent'] or 'no base (full delta)'}")
+        
+        return {'rows': manifest['rows'], 'delta': f"{table_name}/delta.json"}
+    
+    def _link_table_files(self, base_dir: Path, out_dir: Path, table_name: str, table_format: str,
+                          compression: Optional[str]) -> bool:
+        """Link one table's export (single file, or a part directory) from base_dir into out_dir"""
+        file_name = table_file_name(table_name, table_format, compression)
+        if (base_dir / file_name).exists():
+            link_file(base_dir / file_name, out_dir / file_name)
+            return True
+        
+        if (base_dir / table_name / "manifest.json").exists():
+            (out_dir / table_name).mkdir(exist_ok=True)
+            for part_file in (base_dir / table_name).iterdir():
+                link_file(part_file, out_dir / table_name / part_file.name)
+            return True
+        
+        return False
+    
+    def _copy_compression(self) -> str:
+        """COPY files are always streamed through a compressor; gzip unless zstd was requested"""
+        return self.compression or 'gzip'
+    
+    def _write_copy_manifest(self, out_dir: Path, results: Dict[str, Dict]):
+        """
+        Write tables_copy/manifest.json: format, compression and per-table file and column list
+        
+        Split tables point at their own part manifest, and delta tables at their
+        delta manifest, instead of a single file.
+        """
+        tables = {}
+        for table_name, result in results.items():
+            if result.get('parts'):
+                tables[table_name] = {'parts': f"{table_name}/manifest.json", 'rows': result.get('rows')}
+            elif result.get('delta'):
+                tables[table_name] = {'delta': result['delta'], 'rows': result.get('rows')}
+            elif result.get('file'):
+                tables[table_name] = {
+                    'file': result['file'],
+                    'columns': result['columns'],
+                    'rows': result['rows']
+                }
+        
+        manifest = {
+            'format': self.copy_format,
+            'compression': self._copy_compression(),
+            'tables': tables
+        }
+        
+        with open(out_dir / "manifest.json", 'w') as f:
+            json.dump(manifest, f, indent=2)
+    
+    def _export_tables_parallel(self, tables: List[str], out_dir: Path,
+                                plans: Optional[Dict[str, Dict]] = None) -> Dict[str, Dict]:
+        """
+        Export tables across a process pool; JSON encoding is CPU-bound, so threads would serialize on the GIL
+        
+        Tables with a split plan are exported as independent parts, followed by a
+        part manifest once all of their parts have finished.
+        
+        Returns:
+            Per-table worker results (split tables: {'parts': True, 'rows': total})
+        """
+        plans = plans or {}
+        task_count = sum(len(plans[t]['parts']) if t in plans else 1 for t in tables)
+        workers = min(self.table_workers, task_count)
+        print(f"  ℹ️  Exporting {len(tables)} tables ({task_count} tasks) with {workers} worker processes")
+        for table_name, plan in plans.items():
+            print(f"    {table_name}: {len(plan['parts'])} parts by {plan['method']}")
+        
+        compression = self._copy_compression() if self.copy_format else None
+        results = {}
+        part_results = {table_name: [] for table_name in plans}
+        
+        # Spawned, not forked: create_backup runs components on threads, and forking a threaded process is unsafe
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=init_export_worker, initargs=(self.db_url,)) as pool:
+            # The pool queue is FIFO, so submitting largest-first schedules largest-first
+            futures = {}
+            for table_name in tables:
+                if table_name in plans:
+                    for part, where in enumerate(plans[table_name]['parts'], start=1):
+                        future = pool.submit(export_table_worker, self.db_url, table_name, str(out_dir),
+                                             self.json_format, self.itersize, self.snapshot_id, where, part,
+                                             self.copy_format, compression)
+                        futures[future] = (table_name, part)
+                else:
+                    future = pool.submit(export_table_worker, self.db_url, table_name, str(out_dir),
+                                         self.json_format, self.itersize, self.snapshot_id, None, None,
+                                         self.copy_format, compression)
+                    futures[future] = (table_name, None)
+            
+            for future in tqdm(as_completed(futures), total=len(futures), desc="  Exporting tables"):
+                table_name, part = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    label = f"{table_name} part {part}" if part else table_name
+                    print(f"    ⚠ Warning: Could not export table {label}: {e}")
+                    result = {'table': table_name, 'part': part, 'rows': None, 'error': str(e)}
+                
+                if part is not None:
+                    part_results[table_name].append(result)
+                elif 'error' not in result:
+                    results[table_name] = result
+        
+        table_format = self.copy_format or self.json_format
+        for table_name, plan in plans.items():
+            write_part_manifest(out_dir / table_name, table_name, table_format, plan, part_results[table_name],
+                                compression)
+            results[table_name] = {
+                'parts': True,
+                'rows': sum(r['rows'] or 0 for r in part_results[table_name])
+            }
+        
+        return results
     
     def _backup_storage(self, backup_path: Path):
-        """Backup storage buckets and files"""
+        """
+        Backup storage buckets and files
+        
+        Objects are enumerated with one streamed query over storage.objects
+        when the database is reachable, falling back to walking folders over
+        the REST API. Either way, downloads run on a shared work pool
+        (storage_workers at a time) while the listing is still going, and
+        size / mimetype / etag / updated_at / sha256 of every object is
+        written to storage/objects.json.
+        
+        With a base backup, objects whose size, etag and updated_at match its
+        objects.json are hard-linked from there instead of downloaded, and
+        objects that are gone since the base are listed under 'deleted'.
+        """
         storage_dir = backup_path / "storage"
         storage_dir.mkdir(exist_ok=True)
         
+        if self.storage_blobs and not self.blob_store.shares_filesystem(storage_dir):
+            print(f"  ⚠ Warning: Blob store {self.blob_store.root} is on another filesystem than the backup, "
+                  f"so objects cannot be hard-linked to it; --storage-blobs is disabled for this backup")
+            self.storage_blobs = False
+        
         try:
             # Get all buckets
             response = self.supabase.storage.list_buckets()
@@ -201,60 +1021,209 @@ class SupabaseBackup:
                 return
             
             buckets_info = []
+            objects = {}
+            base = self._load_base_objects()
+            progress = TransferProgress("  Downloading objects")
             
-            for bucket in tqdm(response, desc="  Backing up buckets"):
-                bucket_name = bucket.name if hasattr(bucket, 'name') else bucket.get('name')
-                bucket_dir = storage_dir / bucket_name
-                bucket_dir.mkdir(exist_ok=True)
-                
-                # Save bucket metadata
-                bucket_info = {
-                    'name': bucket_name,
-                    'id': bucket.id if hasattr(bucket, 'id') else bucket.get('id'),
-                    'public': bucket.public if hasattr(bucket, 'public') else bucket.get('public', False),
-                }
-                buckets_info.append(bucket_info)
+            with WorkPool(self.storage_workers) as pool:
+                for bucket in response:
+                    bucket_name = bucket.name if hasattr(bucket, 'name') else bucket.get('name')
+                    bucket_dir = storage_dir / bucket_name
+                    bucket_dir.mkdir(exist_ok=True)
+                    
+                    # Save bucket metadata
+                    bucket_info = {
+                        'name': bucket_name,
+                        'id': bucket.id if hasattr(bucket, 'id') else bucket.get('id'),
+                        'public': bucket.public if hasattr(bucket, 'public') else bucket.get('public', False),
+                    }
+                    buckets_info.append(bucket_info)
+                    objects[bucket_name] = {}
                 
                 # List and download files
-                try:
-                    files = self.supabase.storage.from_(bucket_name).list()
-                    self._download_bucket_files(bucket_name, files, bucket_dir)
-                except Exception as e:
-                    print(f"    ⚠ Warning: Could not backup bucket {bucket_name}: {e}")
+                if not self._queue_objects_from_sql(pool, progress, storage_dir, buckets_info, objects, base):
+                    for bucket_info in buckets_info:
+                        pool.submit(self._download_bucket_files, pool, progress, bucket_info['name'],
+                                    storage_dir / bucket_info['name'], objects=objects[bucket_info['name']],
+                                    base=base)
+            
+            stats = progress.close()
             
             # Save buckets metadata
             with open(storage_dir / "buckets_metadata.json", 'w') as f:
                 json.dump(buckets_info, f, indent=2)
             
-            print(f"  ✓ Storage backed up to {storage_dir}")
+            deleted = {}
+            if base:
+                for bucket_name, base_entries in base['buckets'].items():
+                    gone = sorted(set(base_entries) - set(objects.get(bucket_name, {})))
+                    if gone:
+                        deleted[bucket_name] = gone
+                stats['deleted'] = sum(len(names) for names in deleted.values())
+            
+            with open(storage_dir / OBJECT_MANIFEST, 'w') as f:
+                json.dump({
+                    'base': str(self.base_backup) if base else None,
+                    'blob_store': os.path.relpath(self.blob_store.root, storage_dir) if self.storage_blobs else None,
+                    'buckets': objects,
+                    'deleted': deleted
+                }, f)
+            
+            print(f"  ✓ Storage backed up to {storage_dir}: {format_transfer_stats(stats)}")
+            if deleted:
+                print(f"  ℹ️  {stats['deleted']} objects deleted since base backup {self.base_backup.name}")
+            return stats
             
         except Exception as e:
             print(f"  ⚠ Warning: Storage backup failed: {e}")
     
-    def _download_bucket_files(self, bucket_name: str, files: List, bucket_dir: Path, prefix: str = ""):
-        """Recursively download files from a bucket"""
-        for file in files:
-            file_name = file.get('name')
-            file_path = f"{prefix}{file_name}" if prefix else file_name
-            
-            # Check if it's a folder
-            if file.get('id') is None:
-                # It's a folder, recurse
-                folder_dir = bucket_dir / file_name
-                folder_dir.mkdir(exist_ok=True)
-                try:
-                    sub_files = self.supabase.storage.from_(bucket_name).list(file_path)
-                    self._download_bucket_files(bucket_name, sub_files, folder_dir, f"{file_path}/")
-                except Exception as e:
-                    print(f"      ⚠ Warning: Could not list folder {file_path}: {e}")
-            else:
-                # It's a file, download it
-                try:
-                    file_data = self.supabase.storage.from_(bucket_name).download(file_path)
-                    with open(bucket_dir / file_name, 'wb') as f:
-                        f.write(file_data)
-                except Exception as e:
-                    print(f"      ⚠ Warning: Could not download {file_path}: {e}")
+    def _load_base_objects(self) -> Optional[Dict]:
+        """
+        Object manifest of the base backup's storage, if objects can be carried forward from it
+        
+        Returns:
+            Dict with 'dir' (the base's storage folder) and 'buckets' (its objects per bucket), or None
+        """
+        if not self.base_backup:
+            return None
+        
+        base_dir = self.base_backup / "storage"
+        try:
+            manifest = load_object_manifest(base_dir)
+        except Exception as e:
+            print(f"  ⚠ Warning: Could not read the object manifest of {self.base_backup}, downloading all objects: {e}")
+            return None
+        
+        if manifest is None or load_chunk_manifest(self.base_backup) is not None:
+            print(f"  ℹ️  Base backup {self.base_backup.name} has no unpacked storage manifest, downloading all objects")
+            return None
+        
+        return {'dir': base_dir, 'buckets': manifest.get('buckets', {})}
+    
+    def _queue_object(self, pool: WorkPool, progress: TransferProgress, bucket_name: str, file_path: str,
+                      dest: Path, entry: Dict, base: Optional[Dict]):
+        """Link an unchanged object from the base backup, or queue its download"""
+        progress.discovered(1)
+        
+        previous = base['buckets'].get(bucket_name, {}).get(file_path) if base else None
+        if object_unchanged(entry, previous):
+            source = base['dir'] / bucket_name / file_path
+            if source.exists():
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                link_file(source, dest)
+                if previous.get('sha256'):
+                    entry['sha256'] = previous['sha256']
+                progress.reuse(entry['size'])
+                return
+        
+        pool.submit(self._download_object, progress, bucket_name, file_path, dest, entry)
+    
+    def _queue_objects_from_sql(self, pool: WorkPool, progress: TransferProgress, storage_dir: Path,
+                                buckets_info: List[Dict], objects: Dict[str, Dict],
+                                base: Optional[Dict] = None) -> bool:
+        """
+        Enumerate every object of every bucket in one streamed storage.objects query
+        
+        Rows arrive through a server-side cursor; downloads are only queued
+        once the whole listing has been read, so a query that fails partway
+        leaves nothing behind for the REST walk to queue a second time.
+        
+        Returns:
+            True if the listing completed, False to fall back to the REST walk
+        """
+        if not self.db_url:
+            return False
+        
+        bucket_names = {info['id']: info['name'] for info in buckets_info}
+        
+        try:
+            conn = psycopg2.connect(self.db_url)
+        except Exception as e:
+            print(f"  ℹ️  storage.objects not reachable ({e}), listing folders over the API")
+            return False
+        
+        try:
+            cursor = conn.cursor(name="storage_objects")
+            cursor.itersize = STORAGE_LIST_ITERSIZE
+            cursor.execute("""
+                SELECT bucket_id, name, (metadata->>'size')::bigint, metadata->>'mimetype',
+                       metadata->>'eTag', updated_at
+                FROM storage.objects
+                WHERE bucket_id = ANY(%s)
+                ORDER BY bucket_id, name
+            """, (list(bucket_names),))
+            
+            listed = []
+            for bucket_id, name, size, mimetype, etag, updated_at in cursor:
+                listed.append((bucket_names[bucket_id], name, {
+                    'size': size,
+                    'mimetype': mimetype,
+                    'etag': etag,
+                    'updated_at': normalize_timestamp(updated_at)
+                }))
+            
+            cursor.close()
+        except Exception as e:
+            print(f"  ℹ️  Could not list storage.objects ({e}), listing folders over the API")
+            return False
+        finally:
+            conn.close()
+        
+        for bucket_name, name, entry in listed:
+            objects[bucket_name][name] = entry
+            self._queue_object(pool, progress, bucket_name, name, storage_dir / bucket_name / name, entry, base)
+        return True
+    
+    def _download_bucket_files(self, pool: WorkPool, progress: TransferProgress, bucket_name: str,
+                               bucket_dir: Path, objects: Dict, prefix: str = "", base: Optional[Dict] = None):
+        """
+        List one folder of a bucket and queue its contents on the pool
+        
+        The listing is paginated (every page, not just the API's default
+        first 100 entries); files are queued as downloads and sub-folders as
+        further listings as each page arrives.
+        """
+        bucket = self.supabase.storage.from_(bucket_name)
+        try:
+            for file in iter_folder(bucket, prefix.rstrip('/') or None):
+                file_name = file.get('name')
+                file_path = f"{prefix}{file_name}"
+                
+                if file.get('id') is None:
+                    # It's a folder: list it on the pool too
+                    folder_dir = bucket_dir / file_name
+                    folder_dir.mkdir(exist_ok=True)
+                    pool.submit(self._download_bucket_files, pool, progress, bucket_name, folder_dir,
+                                objects, f"{file_path}/", base)
+                else:
+                    metadata = file.get('metadata') or {}
+                    objects[file_path] = {
+                        'size': metadata.get('size'),
+                        'mimetype': metadata.get('mimetype'),
+                        'etag': metadata.get('eTag'),
+                        'updated_at': normalize_timestamp(file.get('updated_at'))
+                    }
+                    self._queue_object(pool, progress, bucket_name, file_path, bucket_dir / file_name,
+                                       objects[file_path], base)
+        except Exception as e:
+            print(f"      ⚠ Warning: Could not list {bucket_name}/{prefix}: {e}")
+    
+    def _download_object(self, progress: TransferProgress, bucket_name: str, file_path: str, dest: Path,
+                         entry: Optional[Dict] = None):
+        """Stream one object to dest, recording its SHA-256 in entry (its objects.json record)"""
+        headers = {
+            'apikey': self.supabase_key,
+            'Authorization': f'Bearer {self.supabase_key}'
+        }
+        try:
+            result = stream_download(object_url(self.supabase_url, bucket_name, file_path), headers, dest,
+                                     self.download_buffer, self.blob_store if self.storage_blobs else None)
+            if entry is not None:
+                entry['sha256'] = result['sha256']
+            progress.done(result['size'])
+        except Exception as e:
+            progress.done(failed=True)
+            print(f"      ⚠ Warning: Could not download {file_path}: {e}")
     
     def _backup_auth(self, backup_path: Path):
         """Backup authentication users"""
@@ -296,7 +1265,7 @@ class SupabaseBackup:
             cmd = f"pg_dumpall {self.db_url.replace('postgres', '')} --roles-only -f {roles_file}"
             
             # Alternative: use psql to get role definitions
-            conn = psycopg2.connect(self.db_url)
+            conn = self._connect()
             cursor = conn.cursor()
             
             # Get custom roles (exclude system roles)
@@ -390,7 +1359,6 @@ class SupabaseBackup:
                 print(f"  ✓ Found local edge functions directory")
                 
                 # Copy all function files
-                import shutil
                 function_count = 0
                 for function_dir in local_functions_dir.iterdir():
                     if function_dir.is_dir() and not function_dir.name.startswith('.'):
@@ -519,7 +1487,7 @@ class SupabaseBackup:
             
             # Get database extensions
             try:
-                conn = psycopg2.connect(self.db_url)
+                conn = self._connect()
                 cursor = conn.cursor()
                 cursor.execute("SELECT extname, extversion FROM pg_extension ORDER BY extname")
                 extensions = [{'name': row[0], 'version': row[1]} for row in cursor.fetchall()]
@@ -553,7 +1521,7 @@ class SupabaseBackup:
             
             # Try to get database webhooks from pg_net or supabase_hooks
             try:
-                conn = psycopg2.connect(self.db_url)
+                conn = self._connect()
                 cursor = conn.cursor()
                 
                 # Check if hooks table exists
@@ -600,7 +1568,7 @@ class SupabaseBackup:
             }
             
             # Get publications
-            conn = psycopg2.connect(self.db_url)
+            conn = self._connect()
             cursor = conn.cursor()
             
             # Get publication details
@@ -643,7 +1611,9 @@ class SupabaseBackup:
             with open(backup_path / "realtime_error.txt", 'w') as f:
                 f.write(f"Error backing up realtime config: {e}\n")
     
-    def _create_metadata(self, backup_path: Path, include_storage: bool, include_auth: bool, include_edge_functions: bool = True):
+    def _create_metadata(self, backup_path: Path, include_storage: bool, include_auth: bool, include_edge_functions: bool = True,
+                         database_info: Optional[Dict] = None, snapshot_info: Optional[Dict] = None,
+                         chunk_info: Optional[Dict] = None, component_info: Optional[Dict] = None):
         """Create metadata file for the backup"""
         metadata = {
             'timestamp': datetime.now().isoformat(),
@@ -651,12 +1621,56 @@ class SupabaseBackup:
             'include_storage': include_storage,
             'include_auth': include_auth,
             'include_edge_functions': include_edge_functions,
-            'backup_version': '1.1'
+            'database': database_info or {'format': 'plain', 'path': 'database.sql', 'jobs': 1},
+            'snapshot': snapshot_info,
+            'chunk_store': chunk_info,
+            'components': component_info,
+            'backup_version': '1.2'
         }
         
         with open(backup_path / "metadata.json", 'w') as f:
             json.dump(metadata, f, indent=2)
     
+    def _pack_backup(self, backup_path: Path) -> Optional[Dict]:
+        """
+        Chunk every file of the backup into the chunk store
+        
+        Returns:
+            Chunk summary for metadata.json, or None if packing failed (files are left in place)
+        """
+        try:
+            chunk_info = self.chunk_store.pack_backup(backup_path)
+            saved = chunk_info['bytes'] - chunk_info['new_bytes']
+            print(f"  ✓ {chunk_info['files']} files, {chunk_info['bytes'] / (1024 * 1024):.1f} MB: "
+                  f"{chunk_info['new_bytes'] / (1024 * 1024):.1f} MB new, "
+                  f"{saved / (1024 * 1024):.1f} MB already in {self.chunk_store.root}")
+            return chunk_info
+        except Exception as e:
+            print(f"  ⚠ Warning: Chunk store packing failed, keeping plain files: {e}")
+            return None
+    
+    def prune_chunk_store(self) -> Dict:
+        """
+        Delete chunks that no packed backup under backup_dir references any more
+        
+        Run after deleting old backups to reclaim their space, and not while a
+        --dedup backup is being written (its chunks are not referenced yet).
+        """
+        backup_paths = [manifest.parent for manifest in self.backup_dir.rglob(CHUNK_MANIFEST)]
+        return self.chunk_store.prune(backup_paths)
+    
+    def prune_blob_store(self) -> Dict:
+        """
+        Delete storage blobs that no backup links to any more
+        
+        Run after deleting old backups; not while a --storage-blobs backup is
+        downloading (a blob is briefly unlinked between landing in the store
+        and being linked into the backup).
+        """
+        if not self.blob_store.root.exists():
+            return {'kept': 0, 'deleted': 0, 'freed_bytes': 0}
+        return self.blob_store.prune()
+    
     def list_backups(self) -> List[Dict]:
         """List all available backups"""
         backups = []
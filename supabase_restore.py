@@ -4,20 +4,90 @@ Handles restoring database, storage, and authentication data to Supabase
 """
 
 import os
+import gzip
 import json
+import hashlib
+import mimetypes
+import shutil
+import itertools
 import subprocess
+import tempfile
+import threading
+from functools import partial
 from pathlib import Path
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import psycopg2
+from psycopg2.extras import execute_values, Json
 from supabase import create_client, Client
 from tqdm import tqdm
 import requests
+from chunk_store import ChunkStore
+from task_graph import TaskGraph
+from storage_transfer import (
+    WorkPool, TransferProgress, format_transfer_stats, iter_local_files, iter_folder, load_object_manifest,
+    object_url, stream_upload, head_object, file_md5, normalize_etag
+)
+
+
+# Compression implied by the suffix of a plain SQL dump
+COMPRESSION_BY_SUFFIX = {
+    '.gz': 'gzip',
+    '.zst': 'zstd',
+}
+
+# Read size when streaming a compressed dump into psql
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+# COPY text-format escapes
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+class _CopyRowStream:
+    """Read-only file-like adapter encoding row dicts as COPY text lines on demand"""
+    
+    def __init__(self, rows: Iterator[Dict], columns: List[str], json_columns: set):
+        self.rows = rows
+        self.columns = columns
+        self.json_columns = json_columns
+        self.buffer = bytearray()
+        self.row_count = 0
+    
+    def _encode_value(self, index: int, value) -> str:
+        if value is None:
+            return '\\N'
+        if index in self.json_columns or isinstance(value, (dict, list)):
+            value = json.dumps(value)
+        elif value is True:
+            return 't'
+        elif value is False:
+            return 'f'
+        else:
+            value = str(value)
+        return value.translate(_COPY_ESCAPES)
+    
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            line = '\t'.join(self._encode_value(i, row.get(col)) for i, col in enumerate(self.columns))
+            self.buffer += (line + '\n').encode('utf-8')
+            self.row_count += 1
+        
+        if size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
 
 
 class SupabaseRestore:
     """Class to handle Supabase restores"""
     
-    def __init__(self, supabase_url: str, supabase_key: str, db_url: str):
+    def __init__(self, supabase_url: str, supabase_key: str, db_url: str, jobs: int = 1, batch_size: int = 0,
+                 task_workers: int = 4, storage_workers: int = 8, skip_unchanged: bool = True):
         """
         Initialize the restore handler
         
@@ -25,17 +95,30 @@ class SupabaseRestore:
             supabase_url: Supabase project URL
             supabase_key: Supabase service role key
             db_url: PostgreSQL database connection URL
+            jobs: Number of parallel pg_restore workers for custom/directory-format dumps
+            batch_size: Commit JSON table loads every this many rows (0 = once per table)
+            task_workers: Restore steps whose dependencies are met run concurrently, at most this many
+            storage_workers: Concurrent storage object uploads
+            skip_unchanged: Do not re-upload objects the target already holds with the same size and checksum
         """
         self.supabase_url = supabase_url
         self.supabase_key = supabase_key
         self.db_url = db_url
+        self.jobs = max(1, jobs)
+        self.batch_size = max(0, batch_size)
+        self.task_workers = max(1, task_workers)
+        self.storage_workers = max(1, storage_workers)
+        self.skip_unchanged = skip_unchanged
+        self._target_buckets: Optional[Dict[str, object]] = None
+        self._buckets_lock = threading.Lock()
         self.supabase: Client = create_client(supabase_url, supabase_key)
     
     def restore_backup(self, backup_path: str, restore_database: bool = True, 
                       restore_storage: bool = True, restore_auth: bool = True,
                       restore_edge_functions: bool = True, restore_roles: bool = True,
                       restore_realtime: bool = True, restore_webhooks: bool = True,
-                      deploy_functions: bool = True, mode: str = 'clean', confirm: bool = False):
+                      deploy_functions: bool = True, mode: str = 'clean', confirm: bool = False,
+                      from_tables: bool = False):
         """
         Restore a backup to Supabase
         
@@ -54,6 +137,9 @@ class SupabaseRestore:
                   - merge: Skip existing objects, add missing only
                   - force: Drop entire public schema, complete rebuild
             confirm: Confirmation flag (safety check)
+            from_tables: Load the public tables' rows from the backup's table export (tables_json/ or
+                         tables_copy/, including split and delta tables) instead of the dump's data;
+                         the schema still comes from the dump's pre-data / post-data sections
         """
         backup_dir = Path(backup_path)
         
@@ -94,45 +180,92 @@ class SupabaseRestore:
                 print("Restore cancelled.")
                 return
         
-        # Apply restore mode preparation
-        if restore_database and mode in ['clean', 'force']:
-            print(f"\n🧹 Preparing database for {mode.upper()} mode...")
-            self._prepare_database_for_restore(mode)
+        # Packed backups are rebuilt next to the original, so relative links to sibling backups still resolve.
+        # Only the files of the components being restored are rebuilt
+        unpacked_dir = None
+        chunk_store = ChunkStore.for_backup(backup_dir)
+        if chunk_store:
+            prefixes = []
+            if restore_database:
+                prefixes.append("database")
+                if from_tables:
+                    prefixes.extend(["tables_json/", "tables_copy/"])
+            if restore_roles:
+                prefixes.append("roles.sql")
+            if restore_storage:
+                prefixes.append("storage/")
+            if restore_auth:
+                prefixes.append("auth_users.json")
+            if restore_edge_functions:
+                prefixes.append("edge_functions/")
+            if restore_realtime:
+                prefixes.append("realtime_config.json")
+            if restore_webhooks:
+                prefixes.append("webhooks.json")
+            
+            print("\n🧩 Rebuilding backup files from chunk store...")
+            unpacked_dir = Path(tempfile.mkdtemp(prefix=f".{backup_dir.name}-restore-", dir=backup_dir.parent))
+            chunk_store.unpack_backup(backup_dir, unpacked_dir, prefixes=prefixes)
+            backup_dir = unpacked_dir
         
-        # Restore database roles FIRST (before database)
+        # Each step names what has to happen before it; independent steps run in parallel
+        # (e.g. edge functions alongside the database load)
+        graph = TaskGraph()
+        if restore_database:
+            # Checked before anything is dropped or applied
+            graph.add('checksum', partial(self._run_step, "🔎 Verifying database dump checksums...",
+                                          self._verify_database_dump, backup_dir, mode=mode,
+                                          dump_info=metadata.get('database')))
+        if restore_database and mode in ['clean', 'force']:
+            graph.add('prepare', partial(self._run_step, f"🧹 Preparing database for {mode.upper()} mode...",
+                                         self._prepare_database_for_restore, mode), deps=['checksum'])
         if restore_roles:
-            print("\n👥 Restoring database roles...")
-            self._restore_database_roles(backup_dir)
-        
-        # Restore database
+            graph.add('roles', partial(self._run_step, "👥 Restoring database roles...",
+                                       self._restore_database_roles, backup_dir), deps=['prepare'])
         if restore_database:
-            print("\n📊 Restoring database...")
-            self._restore_database(backup_dir, mode=mode)
-        
-        # Restore storage
+            restore_method = self._restore_database_from_tables if from_tables else self._restore_database
+            graph.add('database', partial(self._run_step, "📊 Restoring database...", restore_method,
+                                          backup_dir, mode=mode, dump_info=metadata.get('database')),
+                      deps=['checksum', 'prepare', 'roles'])
         if restore_storage and metadata.get('include_storage', False):
-            print("\n📁 Restoring storage files...")
-            self._restore_storage(backup_dir)
-        
-        # Restore auth
+            # The database step recreates storage.buckets/objects (and may drop them in clean
+            # mode), so uploads only start once it has finished
+            graph.add('storage', partial(self._run_step, "📁 Restoring storage files...",
+                                         self._restore_storage, backup_dir, database_restored=restore_database),
+                      deps=['database'])
         if restore_auth and metadata.get('include_auth', False):
-            print("\n👤 Restoring auth users...")
-            self._restore_auth(backup_dir)
-        
-        # Restore edge functions
+            # Auth after database: on_auth_user_created triggers write to public tables, and
+            # the dump brings its own auth.users rows
+            graph.add('auth', partial(self._run_step, "👤 Restoring auth users...",
+                                      self._restore_auth, backup_dir), deps=['roles', 'database'])
         if restore_edge_functions and metadata.get('include_edge_functions', False):
-            print("\n⚡ Restoring edge functions...")
-            self._restore_edge_functions(backup_dir, deploy=deploy_functions)
-        
-        # Restore realtime configuration
+            graph.add('edge_functions', partial(self._run_step, "⚡ Restoring edge functions...",
+                                                self._restore_edge_functions, backup_dir, deploy=deploy_functions))
         if restore_realtime:
-            print("\n📡 Restoring realtime configuration...")
-            self._restore_realtime_config(backup_dir)
-        
-        # Restore webhooks
+            graph.add('realtime', partial(self._run_step, "📡 Restoring realtime configuration...",
+                                          self._restore_realtime_config, backup_dir), deps=['database'])
         if restore_webhooks:
-            print("\n🔗 Restoring webhooks...")
-            self._restore_webhooks(backup_dir)
+            graph.add('webhooks', partial(self._run_step, "🔗 Restoring webhooks...",
+                                          self._restore_webhooks, backup_dir), deps=['database'])
+        
+        try:
+            results = graph.run(self.task_workers)
+        finally:
+            if unpacked_dir:
+                shutil.rmtree(unpacked_dir, ignore_errors=True)
+        
+        print("\n📋 Restore steps:")
+        for name in graph.tasks:
+            result = results[name]
+            symbol = {'ok': '✓', 'skipped': '–'}.get(result['status'], '✗')
+            retried = f", {result['attempts']} attempts" if result['attempts'] > 1 else ""
+            error = f"  {result['error']}" if result['error'] else ""
+            print(f"  {symbol} {name:<16} {result['seconds']:7.1f}s{retried}{error}")
+        print(graph.timing_report())
+        
+        failed = [name for name, result in results.items() if result['status'] != 'ok']
+        if failed:
+            raise Exception(f"Restore steps did not complete: {', '.join(failed)}")
         
         print("\n✅ Restore completed successfully!")
         print("\n💡 Next steps:")
@@ -140,6 +273,11 @@ class SupabaseRestore:
         print("   2. Deploy edge functions if any: npx supabase functions deploy --all")
         print("   3. Test your application")
     
+    def _run_step(self, banner: str, method, *args, **kwargs):
+        """Task body of one restore step: print its banner and run it"""
+        print(f"\n{banner}")
+        return method(*args, **kwargs)
+    
     def _prepare_database_for_restore(self, mode: str):
         """Prepare database for restore based on mode"""
         try:
@@ -187,25 +325,103 @@ class SupabaseRestore:
             print(f"  ⚠️  Warning: Database preparation had issues: {e}")
             raise
     
-    def _restore_database(self, backup_dir: Path, mode: str = 'clean'):
-        """Restore database from SQL dump"""
-        dump_file = backup_dir / "database.sql"
+    def _resolve_database_dump(self, backup_dir: Path, dump_info: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        Locate the database dump of a backup and determine its format
+        
+        Uses the 'database' entry of metadata.json when present, otherwise
+        probes for the files written by known pg_dump formats.
+        
+        Returns:
+            Dict with 'format' ('plain', 'custom', 'directory' or 'sections'), 'path', 'compression'
+            and expected 'sha256' (when recorded), or None if no dump exists. Sectioned dumps
+            carry the plain dump info of each section under 'sections', in restore order.
+        """
+        if dump_info and dump_info.get('format') == 'sections' and dump_info.get('sections'):
+            return {
+                'format': 'sections',
+                'path': backup_dir / dump_info['path'],
+                'sections': [
+                    (section, {'format': 'plain', **dump_info['sections'][section]})
+                    for section in ('pre-data', 'data', 'post-data') if section in dump_info['sections']
+                ]
+            }
+        
+        if dump_info and dump_info.get('path'):
+            dump_path = backup_dir / dump_info['path']
+            if dump_path.exists():
+                return {
+                    'format': dump_info.get('format', 'plain'),
+                    'path': dump_path,
+                    'compression': dump_info.get('compression') or COMPRESSION_BY_SUFFIX.get(dump_path.suffix),
+                    'sha256': dump_info.get('sha256')
+                }
+        
+        candidates = [
+            ('directory', backup_dir / "database" / "toc.dat"),
+            ('custom', backup_dir / "database.dump"),
+            ('plain', backup_dir / "database.sql"),
+            ('plain', backup_dir / "database.sql.gz"),
+            ('plain', backup_dir / "database.sql.zst"),
+        ]
+        for dump_format, marker in candidates:
+            if marker.exists():
+                dump_path = marker.parent if dump_format == 'directory' else marker
+                compression = COMPRESSION_BY_SUFFIX.get(dump_path.suffix) if dump_format == 'plain' else None
+                return {'format': dump_format, 'path': dump_path, 'compression': compression, 'sha256': None}
+        
+        return None
+    
+    def _restore_database(self, backup_dir: Path, mode: str = 'clean', dump_info: Optional[Dict] = None,
+                          section: Optional[str] = None):
+        """
+        Restore database from a pg_dump archive (plain SQL, custom or directory format)
+        
+        Args:
+            section: Only restore this section ('pre-data', 'data' or 'post-data'); needs a
+                     sectioned or custom/directory-format dump
+        """
+        dump = self._resolve_database_dump(backup_dir, dump_info)
+        
+        if dump is None:
+            print("  ⚠ Warning: database dump not found, skipping database restore")
+            return
         
-        if not dump_file.exists():
-            print("  ⚠ Warning: database.sql not found, skipping database restore")
+        if dump['format'] == 'sections':
+            # Sectioned plain dump: schema, then data, then indexes/constraints/triggers
+            for name, section_info in dump['sections']:
+                if section and name != section:
+                    continue
+                print(f"  ℹ️  Restoring {name} section")
+                self._restore_database(backup_dir, mode=mode, dump_info=section_info)
             return
         
+        if section and dump['format'] not in ('custom', 'directory'):
+            raise Exception(f"A {dump['format']} dump cannot be restored section by section")
+        
+        dump_file = dump['path']
+        
         try:
-            # Use psql to restore the database
-            if mode == 'merge':
-                # MERGE mode: Use ON CONFLICT DO NOTHING for inserts
-                print("  ℹ️  MERGE mode: Errors for existing objects will be ignored")
-                cmd = f"psql {self.db_url} -f {dump_file} --set ON_ERROR_STOP=off"
+            if dump['format'] in ('custom', 'directory'):
+                # Archive formats: pg_restore loads tables and builds indexes in parallel
+                print(f"  ℹ️  {dump['format'].capitalize()}-format dump, using pg_restore with {self.jobs} job(s)")
+                section_option = f" --section={section}" if section else ""
+                cmd = f"pg_restore -d {self.db_url} -j {self.jobs} --no-owner --no-acl{section_option} {dump_file}"
             else:
-                # CLEAN/FORCE mode: Stop on errors
-                cmd = f"psql {self.db_url} -f {dump_file}"
+                # Compressed plain dumps are decompressed on the fly into psql's stdin
+                sql_source = "-" if dump.get('compression') else dump_file
+                if mode == 'merge':
+                    # MERGE mode: Use ON CONFLICT DO NOTHING for inserts
+                    print("  ℹ️  MERGE mode: Errors for existing objects will be ignored")
+                    cmd = f"psql {self.db_url} -f {sql_source} --set ON_ERROR_STOP=off"
+                else:
+                    # CLEAN/FORCE mode: Stop on errors
+                    cmd = f"psql {self.db_url} -f {sql_source}"
             
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+            if dump['format'] == 'plain' and dump.get('compression'):
+                result = self._stream_compressed_dump(cmd, dump_file, dump['compression'])
+            else:
+                result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
             
             if result.returncode != 0:
                 if mode == 'merge':
@@ -223,8 +439,162 @@ class SupabaseRestore:
             print(f"  ⚠ Warning: Database restore failed: {e}")
             raise
     
+    def _open_decompressor(self, source, compression: Optional[str]):
+        """Wrap a binary source in a streaming decompressor ('gzip', 'zstd'); None returns it unchanged"""
+        if compression is None:
+            return source
+        
+        if compression == 'gzip':
+            return gzip.GzipFile(fileobj=source, mode='rb')
+        
+        if compression == 'zstd':
+            try:
+                import zstandard
+            except ImportError:
+                raise Exception("zstd-compressed files require the 'zstandard' package (pip install zstandard)")
+            return zstandard.ZstdDecompressor().stream_reader(source, closefd=False)
+        
+        raise ValueError(f"Unsupported compression: {compression}")
+    
+    def _verify_database_dump(self, backup_dir: Path, mode: str = 'clean', dump_info: Optional[Dict] = None):
+        """Check every dump file (each section of a sectioned dump) against its recorded SHA-256"""
+        dump = self._resolve_database_dump(backup_dir, dump_info)
+        if dump is None:
+            return
+        
+        if dump['format'] == 'sections':
+            for _, section_info in dump['sections']:
+                self._verify_database_dump(backup_dir, mode=mode, dump_info=section_info)
+            return
+        
+        if not dump.get('sha256') or not Path(dump['path']).is_file():
+            print(f"  ℹ️  No checksum recorded for {Path(dump['path']).name}, not verified")
+            return
+        
+        self._verify_dump_checksum(Path(dump['path']), dump['sha256'], mode)
+    
+    def _verify_dump_checksum(self, dump_file: Path, expected_sha256: str, mode: str):
+        """
+        Compare a dump file with the SHA-256 recorded at backup time, before anything is applied
+        
+        Raises on a mismatch in clean and force modes; merge mode only warns.
+        """
+        sha256 = hashlib.sha256()
+        with open(dump_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), b''):
+                sha256.update(chunk)
+        
+        actual_sha256 = sha256.hexdigest()
+        if actual_sha256 == expected_sha256:
+            print(f"  ✓ Checksum verified for {dump_file.name}")
+            return
+        
+        message = f"{dump_file.name} checksum mismatch (expected {expected_sha256[:12]}…, got {actual_sha256[:12]}…)"
+        if mode in ('clean', 'force'):
+            raise Exception(f"{message}; refusing to restore a corrupt dump")
+        print(f"  ⚠ Warning: {message}")
+    
+    def _stream_compressed_dump(self, cmd: str, dump_file: Path, compression: str) -> subprocess.CompletedProcess:
+        """Decompress a plain SQL dump on the fly into psql's stdin"""
+        with tempfile.TemporaryFile() as stderr_file, open(dump_file, 'rb') as source:
+            reader = self._open_decompressor(source, compression)
+            
+            proc = subprocess.Popen(cmd, shell=True, stdin=subprocess.PIPE,
+                                    stdout=subprocess.DEVNULL, stderr=stderr_file)
+            try:
+                while True:
+                    chunk = reader.read(STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    proc.stdin.write(chunk)
+            except BrokenPipeError:
+                # psql exited early; its stderr explains why
+                pass
+            finally:
+                reader.close()
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+                returncode = proc.wait()
+            
+            stderr_file.seek(0)
+            stderr = stderr_file.read().decode(errors='replace')
+        
+        return subprocess.CompletedProcess(cmd, returncode, stdout='', stderr=stderr)
+    
+    def _restore_database_from_tables(self, backup_dir: Path, mode: str = 'clean', dump_info: Optional[Dict] = None):
+        """
+        Restore the schema from the dump and the public tables' rows from the table export
+        
+        The dump's pre-data section creates the tables, the table export is
+        loaded with COPY (whole, split and delta tables), then post-data adds
+        indexes, constraints and triggers, so rows load without index upkeep
+        or foreign-key checks. Only the dump's data section is replaced:
+        data outside the public schema is not restored on this path.
+        
+        The data section is also where pg_dump keeps the sequence values
+        (SEQUENCE SET), so the public tables' serial/identity sequences are
+        moved past the loaded keys afterwards.
+        """
+        if not (backup_dir / "tables_copy" / "manifest.json").exists() and not (backup_dir / "tables_json").exists():
+            raise Exception("Backup has no table export (tables_json/ or tables_copy/) to restore from")
+        
+        dump = self._resolve_database_dump(backup_dir, dump_info)
+        if dump is None or dump['format'] not in ('sections', 'custom', 'directory'):
+            if mode != 'merge':
+                raise Exception("Restoring from the table export takes the schema from a sectioned (--reuse-schema) "
+                                "or custom/directory-format dump; with a plain dump, use merge mode into an "
+                                "existing schema")
+            print("  ℹ️  No separable schema in this backup, loading tables into the existing schema")
+            self._restore_database_from_json(backup_dir)
+            self._reset_table_sequences()
+            return
+        
+        self._restore_database(backup_dir, mode=mode, dump_info=dump_info, section='pre-data')
+        self._restore_database_from_json(backup_dir)
+        self._restore_database(backup_dir, mode=mode, dump_info=dump_info, section='post-data')
+        self._reset_table_sequences()
+    
+    def _reset_table_sequences(self):
+        """
+        Set every serial/identity sequence of a public table to the highest value in its column
+        
+        Empty tables get their sequence back at its start value, so the next
+        INSERT draws the first number again.
+        """
+        conn = psycopg2.connect(self.db_url)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT format('SELECT setval(%L, coalesce(max(%I), %s), max(%I) IS NOT NULL) FROM %s',
+                              s.oid::regclass::text, a.attname, seq.seqstart, a.attname, t.oid::regclass)
+                FROM pg_class s
+                JOIN pg_sequence seq ON seq.seqrelid = s.oid
+                JOIN pg_depend d ON d.classid = 'pg_class'::regclass AND d.objid = s.oid
+                                AND d.refclassid = 'pg_class'::regclass AND d.deptype IN ('a', 'i')
+                JOIN pg_class t ON t.oid = d.refobjid
+                JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = d.refobjsubid
+                WHERE s.relkind = 'S' AND t.relnamespace = 'public'::regnamespace
+            """)
+            statements = [row[0] for row in cursor.fetchall()]
+            for statement in statements:
+                cursor.execute(statement)
+            conn.commit()
+            cursor.close()
+            print(f"  ✓ {len(statements)} table sequences set past the restored rows")
+        except Exception as e:
+            conn.rollback()
+            print(f"  ⚠ Warning: Could not reset table sequences: {e}")
+        finally:
+            conn.close()
+    
     def _restore_database_from_json(self, backup_dir: Path):
-        """Alternative: Restore database from JSON files"""
+        """Alternative: Restore database from JSON files (or COPY files, when the backup has them)"""
+        if (backup_dir / "tables_copy" / "manifest.json").exists():
+            self._restore_database_from_copy(backup_dir)
+            return
+        
         json_dir = backup_dir / "tables_json"
         
         if not json_dir.exists():
@@ -233,48 +603,302 @@ class SupabaseRestore:
         
         try:
             conn = psycopg2.connect(self.db_url)
-            cursor = conn.cursor()
             
-            json_files = sorted(json_dir.glob("*.json"))
+            json_files = sorted(list(json_dir.glob("*.json")) + list(json_dir.glob("*.ndjson")))
             
             for json_file in tqdm(json_files, desc="  Restoring tables"):
                 table_name = json_file.stem
                 
                 try:
-                    with open(json_file, 'r') as f:
-                        data = json.load(f)
-                    
-                    if not data:
-                        continue
-                    
-                    # Get column names from first row
-                    columns = list(data[0].keys())
-                    
-                    # Prepare insert statement
-                    placeholders = ', '.join(['%s'] * len(columns))
-                    columns_str = ', '.join([f'"{col}"' for col in columns])
-                    insert_sql = f'INSERT INTO "{table_name}" ({columns_str}) VALUES ({placeholders})'
-                    
-                    # Insert data
-                    for row in data:
-                        values = [row[col] for col in columns]
-                        cursor.execute(insert_sql, values)
-                    
-                    conn.commit()
-                    
+                    self._load_table_rows(conn, table_name, self._iter_table_file(json_file))
                 except Exception as e:
                     print(f"    ⚠ Warning: Could not restore table {table_name}: {e}")
                     conn.rollback()
             
-            cursor.close()
             conn.close()
+            
+            # Tables split into parts at backup time (tables_json/<table>/manifest.json)
+            for manifest_file in sorted(json_dir.glob("*/manifest.json")):
+                self._restore_table_parts(manifest_file)
+            
+            # Tables backed up in delta mode (tables_json/<table>/delta.json)
+            for manifest_file in sorted(json_dir.glob("*/delta.json")):
+                self._restore_delta_table(manifest_file, backup_dir)
+            
             print(f"  ✓ Tables restored from JSON")
             
         except Exception as e:
             print(f"  ⚠ Warning: JSON restore failed: {e}")
     
-    def _restore_storage(self, backup_dir: Path):
-        """Restore storage buckets and files"""
+    def _restore_database_from_copy(self, backup_dir: Path):
+        """Restore tables exported with COPY ... TO STDOUT using COPY ... FROM STDIN"""
+        copy_dir = backup_dir / "tables_copy"
+        
+        try:
+            with open(copy_dir / "manifest.json", 'r') as f:
+                manifest = json.load(f)
+            
+            copy_format = manifest['format']
+            compression = manifest.get('compression')
+            tables = manifest.get('tables', {})
+            
+            conn = psycopg2.connect(self.db_url)
+            
+            for table_name, info in tqdm(tables.items(), desc="  Restoring tables"):
+                if info.get('parts') or info.get('delta'):
+                    continue
+                try:
+                    self._copy_into_table(conn, table_name, copy_dir / info['file'], copy_format,
+                                          info['columns'], compression)
+                    conn.commit()
+                except Exception as e:
+                    print(f"    ⚠ Warning: Could not restore table {table_name}: {e}")
+                    conn.rollback()
+            
+            conn.close()
+            
+            for table_name, info in tables.items():
+                if info.get('parts'):
+                    self._restore_table_parts(copy_dir / info['parts'])
+                elif info.get('delta'):
+                    self._restore_delta_table(copy_dir / info['delta'], backup_dir)
+            
+            print(f"  ✓ Tables restored with COPY ({copy_format})")
+            
+        except Exception as e:
+            print(f"  ⚠ Warning: COPY restore failed: {e}")
+    
+    def _copy_into_table(self, conn, table_name: str, copy_file: Path, copy_format: str, columns: List[str],
+                         compression: Optional[str] = None) -> int:
+        """
+        Stream a (compressed) COPY file into a table with COPY ... FROM STDIN
+        
+        Returns:
+            Number of rows loaded
+        """
+        column_list = ', '.join(f'"{column}"' for column in columns)
+        cursor = conn.cursor()
+        try:
+            with open(copy_file, 'rb') as f:
+                reader = self._open_decompressor(f, compression)
+                cursor.copy_expert(f'COPY "{table_name}" ({column_list}) FROM STDIN WITH (FORMAT {copy_format})',
+                                   reader, size=STREAM_CHUNK_SIZE)
+            return cursor.rowcount
+        finally:
+            cursor.close()
+    
+    def _iter_table_file(self, json_file: Path) -> Iterator[Dict]:
+        """
+        Stream the rows of a JSON array or NDJSON table export
+        
+        NDJSON and the one-row-per-line arrays written by the table exporter are
+        read line by line; older pretty-printed arrays fall back to json.load.
+        """
+        with open(json_file, 'r') as f:
+            if json_file.suffix == '.ndjson':
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+                return
+            
+            first = f.readline().strip()
+            if first == '[]' or not first:
+                return
+            
+            streamed = 0
+            if first == '[':
+                for line in f:
+                    line = line.strip().rstrip(',')
+                    if not line or line == ']':
+                        continue
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        if streamed:
+                            raise
+                        # Multi-line (indented) array from an older backup
+                        break
+                    streamed += 1
+                    yield row
+                else:
+                    return
+        
+        with open(json_file, 'r') as f:
+            yield from json.load(f)
+    
+    def _table_column_types(self, conn, table_name: str) -> Dict[str, tuple]:
+        """Map column name -> (type name, type category) for a target table"""
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT a.attname, t.typname, t.typcategory
+            FROM pg_attribute a
+            JOIN pg_type t ON t.oid = a.atttypid
+            WHERE a.attrelid = %s::regclass
+            AND a.attnum > 0
+            AND NOT a.attisdropped
+        """, (f'"{table_name}"',))
+        column_types = {name: (type_name, category) for name, type_name, category in cursor.fetchall()}
+        cursor.close()
+        return column_types
+    
+    def _load_table_rows(self, conn, table_name: str, rows: Iterator[Dict]) -> int:
+        """
+        Bulk-load exported rows into a table
+        
+        Rows are streamed into COPY ... FROM STDIN; tables with array columns
+        (whose JSON lists need PostgreSQL array literals) use execute_values
+        batches instead. Commits once per table, or every `batch_size` rows.
+        
+        Returns:
+            Number of rows loaded
+        """
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            return 0
+        rows = itertools.chain([first], rows)
+        
+        # Get column names from first row
+        columns = list(first.keys())
+        column_types = self._table_column_types(conn, table_name)
+        json_columns = {i for i, col in enumerate(columns) if column_types.get(col, ('', ''))[0] in ('json', 'jsonb')}
+        use_copy = not any(column_types.get(col, ('', ''))[1] == 'A' for col in columns)
+        
+        columns_str = ', '.join([f'"{col}"' for col in columns])
+        cursor = conn.cursor()
+        loaded = 0
+        
+        try:
+            while True:
+                batch = itertools.islice(rows, self.batch_size) if self.batch_size else rows
+                
+                if use_copy:
+                    stream = _CopyRowStream(batch, columns, json_columns)
+                    cursor.copy_expert(f'COPY "{table_name}" ({columns_str}) FROM STDIN', stream,
+                                       size=STREAM_CHUNK_SIZE)
+                    batch_count = stream.row_count
+                else:
+                    values = [
+                        tuple(
+                            Json(row.get(col)) if i in json_columns and row.get(col) is not None else row.get(col)
+                            for i, col in enumerate(columns)
+                        )
+                        for row in batch
+                    ]
+                    execute_values(cursor, f'INSERT INTO "{table_name}" ({columns_str}) VALUES %s', values,
+                                   page_size=1000)
+                    batch_count = len(values)
+                
+                conn.commit()
+                loaded += batch_count
+                
+                if not self.batch_size or batch_count < self.batch_size:
+                    break
+        finally:
+            cursor.close()
+        
+        return loaded
+    
+    def _restore_table_parts(self, manifest_file: Path):
+        """Load the parts of a split table concurrently, one connection per part"""
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+        
+        table_name = manifest['table']
+        table_dir = manifest_file.parent
+        parts = manifest.get('parts', [])
+        
+        if not manifest.get('complete', True):
+            print(f"    ⚠ Warning: Backup of table {table_name} is incomplete, restoring the parts that exist")
+        
+        files = [(f"part {part['part']}", table_dir / part['file']) for part in parts]
+        restored = self._load_table_files(table_name, files, manifest.get('format'), manifest.get('columns'),
+                                          manifest.get('compression'))
+        
+        print(f"    ✓ {table_name}: {restored} rows from {len(parts)} parts")
+    
+    def _restore_delta_table(self, manifest_file: Path, backup_dir: Path):
+        """
+        Restore a table backed up in delta mode (<export dir>/<table>/delta.json)
+        
+        Each chunk names the backup holding its file ('source', relative to
+        backup_dir), so unchanged chunks are read from the base or an earlier
+        delta in the chain. Those backups must still sit next to this one.
+        """
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+        
+        table_name = manifest['table']
+        export_dir_name = manifest_file.parent.parent.name
+        chunks = manifest.get('chunks', {})
+        
+        files = []
+        for chunk, info in sorted(chunks.items(), key=lambda item: int(item[0])):
+            chunk_file = backup_dir / info.get('source', '.') / export_dir_name / info['file']
+            if not chunk_file.exists():
+                print(f"    ⚠ Warning: {table_name} chunk {chunk} is missing ({chunk_file}); is the base backup still there?")
+                continue
+            files.append((f"chunk {chunk}", chunk_file))
+        
+        restored = self._load_table_files(table_name, files, manifest.get('format'), manifest.get('columns'),
+                                          manifest.get('compression'))
+        
+        carried = sum(1 for info in chunks.values() if info.get('source', '.') != '.')
+        print(f"    ✓ {table_name}: {restored} rows from {len(chunks)} chunks ({carried} from earlier backups)")
+    
+    def _load_table_files(self, table_name: str, files: List[tuple], table_format: Optional[str],
+                          columns: Optional[List[str]] = None, compression: Optional[str] = None) -> int:
+        """
+        Load several export files of one table concurrently, one connection per file
+        
+        Args:
+            files: (label, path) pairs; missing files are skipped
+            table_format: 'text'/'binary' for COPY files, anything else for JSON/NDJSON
+            columns: Column list of COPY files
+        
+        Returns:
+            Total number of rows loaded
+        """
+        copy_format = table_format if table_format in ('text', 'binary') else None
+        
+        def load_file(path: Path) -> int:
+            if not path.exists():
+                return 0
+            conn = psycopg2.connect(self.db_url)
+            try:
+                if copy_format:
+                    row_count = self._copy_into_table(conn, table_name, path, copy_format, columns, compression)
+                    conn.commit()
+                    return row_count
+                return self._load_table_rows(conn, table_name, self._iter_table_file(path))
+            finally:
+                conn.close()
+        
+        restored = 0
+        with ThreadPoolExecutor(max_workers=max(1, min(self.jobs, len(files)))) as pool:
+            futures = {pool.submit(load_file, path): label for label, path in files}
+            for future in tqdm(as_completed(futures), total=len(futures), desc=f"  Restoring {table_name}"):
+                try:
+                    restored += future.result()
+                except Exception as e:
+                    print(f"    ⚠ Warning: Could not restore {table_name} {futures[future]}: {e}")
+        
+        return restored
+    
+    def _restore_storage(self, backup_dir: Path, database_restored: bool = False):
+        """
+        Restore storage buckets and files
+        
+        The target's buckets are listed once; missing buckets are created
+        in parallel, then the files of every bucket are streamed from disk on
+        one shared upload pool (storage_workers at a time), with throughput
+        reported per bucket. Objects the target already serves with the same
+        size and checksum are skipped (e.g. when re-running a failed restore).
+        
+        Args:
+            database_restored: The database step of this restore ran, so storage.objects
+                               holds the backup's rows whether or not their bodies exist
+        """
         storage_dir = backup_dir / "storage"
         
         if not storage_dir.exists():
@@ -288,33 +912,21 @@ class SupabaseRestore:
                 with open(metadata_file, 'r') as f:
                     buckets_info = json.load(f)
                 
-                # Create buckets
-                for bucket_info in tqdm(buckets_info, desc="  Creating buckets"):
-                    bucket_name = bucket_info['name']
-                    try:
-                        # Check if bucket exists
-                        existing_buckets = self.supabase.storage.list_buckets()
-                        bucket_exists = any(
-                            (b.name if hasattr(b, 'name') else b.get('name')) == bucket_name 
-                            for b in existing_buckets
-                        )
-                        
-                        if not bucket_exists:
-                            # Create bucket with full configuration
-                            bucket_options = {
-                                'public': bucket_info.get('public', False)
-                            }
+                # Create missing buckets (one listing, creations in parallel)
+                target_buckets = self._bucket_index(refresh=True)
+                missing = [info for info in buckets_info if info['name'] not in target_buckets]
+                if missing:
+                    with ThreadPoolExecutor(max_workers=min(self.storage_workers, len(missing))) as executor:
+                        futures = {executor.submit(self._create_bucket, info): info for info in missing}
+                        for future in as_completed(futures):
+                            bucket_info = futures[future]
+                            try:
+                                future.result()
+                            except Exception as e:
+                                print(f"    ⚠ Warning: Could not restore bucket {bucket_info['name']}: {e}")
+                                continue
                             
-                            # Add file size limit if specified
-                            if bucket_info.get('file_size_limit'):
-                                bucket_options['fileSizeLimit'] = bucket_info['file_size_limit']
-                            
-                            # Add allowed MIME types if specified
-                            if bucket_info.get('allowed_mime_types'):
-                                bucket_options['allowedMimeTypes'] = bucket_info['allowed_mime_types']
-                            
-                            self.supabase.storage.create_bucket(bucket_name, options=bucket_options)
-                            print(f"    ✓ Created bucket: {bucket_name}")
+                            print(f"    ✓ Created bucket: {bucket_info['name']}")
                             
                             # Log configuration
                             if bucket_info.get('file_size_limit'):
@@ -322,41 +934,173 @@ class SupabaseRestore:
                                 print(f"      - Size limit: {size_mb:.1f} MB")
                             if bucket_info.get('allowed_mime_types'):
                                 print(f"      - MIME types: {len(bucket_info['allowed_mime_types'])} types")
-                        
-                        # Upload files
+                
+                ready = [info['name'] for info in buckets_info if info['name'] in self._bucket_index()]
+                
+                # Upload files
+                manifest = load_object_manifest(storage_dir) or {}
+                objects = manifest.get('buckets', {})
+                # Rows the database step just loaded say nothing about the bodies: without
+                # an inventory every object is checked on the target before it is skipped
+                inventory = None
+                if self.skip_unchanged and not database_restored:
+                    inventory = self._target_inventory(ready)
+                progress = TransferProgress("  Uploading objects")
+                with WorkPool(self.storage_workers) as pool:
+                    for bucket_name in ready:
                         bucket_dir = storage_dir / bucket_name
                         if bucket_dir.exists():
-                            self._upload_bucket_files(bucket_name, bucket_dir)
-                        
-                    except Exception as e:
-                        print(f"    ⚠ Warning: Could not restore bucket {bucket_name}: {e}")
+                            pool.submit(self._upload_bucket_files, pool, progress, bucket_name, bucket_dir,
+                                        objects.get(bucket_name, {}),
+                                        inventory.get(bucket_name, {}) if inventory is not None else None)
+                stats = progress.close()
+                
+                for bucket_name, bucket_stats in stats['groups'].items():
+                    print(f"    {bucket_name:<24} {format_transfer_stats(bucket_stats)}")
+                print(f"  ✓ Storage restored: {format_transfer_stats(stats)}")
+                return stats
             
             print(f"  ✓ Storage restored")
             
         except Exception as e:
             print(f"  ⚠ Warning: Storage restore failed: {e}")
     
-    def _upload_bucket_files(self, bucket_name: str, bucket_dir: Path, prefix: str = ""):
-        """Recursively upload files to a bucket"""
-        for item in bucket_dir.iterdir():
-            if item.is_file():
-                file_path = f"{prefix}{item.name}" if prefix else item.name
-                try:
-                    with open(item, 'rb') as f:
-                        file_data = f.read()
-                    
-                    self.supabase.storage.from_(bucket_name).upload(
-                        file_path,
-                        file_data,
-                        file_options={"upsert": "true"}
-                    )
-                except Exception as e:
-                    print(f"      ⚠ Warning: Could not upload {file_path}: {e}")
+    def _bucket_index(self, refresh: bool = False) -> Dict[str, object]:
+        """
+        Buckets of the target project by name, listed once and kept up to date as buckets are created
+        
+        Args:
+            refresh: List the buckets again instead of using the cached index
+        """
+        with self._buckets_lock:
+            if self._target_buckets is None or refresh:
+                self._target_buckets = {
+                    (b.name if hasattr(b, 'name') else b.get('name')): b
+                    for b in self.supabase.storage.list_buckets()
+                }
+            return self._target_buckets
+    
+    def _create_bucket(self, bucket_info: Dict):
+        """Create one bucket with its backed-up configuration and add it to the bucket index"""
+        bucket_name = bucket_info['name']
+        
+        # Create bucket with full configuration
+        bucket_options = {
+            'public': bucket_info.get('public', False)
+        }
+        
+        # Add file size limit if specified
+        if bucket_info.get('file_size_limit'):
+            bucket_options['fileSizeLimit'] = bucket_info['file_size_limit']
+        
+        # Add allowed MIME types if specified
+        if bucket_info.get('allowed_mime_types'):
+            bucket_options['allowedMimeTypes'] = bucket_info['allowed_mime_types']
+        
+        self.supabase.storage.create_bucket(bucket_name, options=bucket_options)
+        with self._buckets_lock:
+            self._target_buckets[bucket_name] = bucket_info
+    
+    def _target_inventory(self, bucket_names: List[str]) -> Dict[str, Dict[str, Dict]]:
+        """
+        Objects already in the target buckets: {bucket: {key: {'size', 'etag'}}}
+        
+        Read with one streamed storage.objects query when the database is
+        reachable, otherwise by walking the buckets with paginated listings.
+        """
+        inventory = {bucket_name: {} for bucket_name in bucket_names}
+        if not bucket_names:
+            return inventory
+        
+        try:
+            conn = psycopg2.connect(self.db_url)
+            try:
+                cursor = conn.cursor(name="target_objects")
+                cursor.itersize = 5000
+                cursor.execute("""
+                    SELECT b.name, o.name, (o.metadata->>'size')::bigint, o.metadata->>'eTag'
+                    FROM storage.objects o
+                    JOIN storage.buckets b ON b.id = o.bucket_id
+                    WHERE b.name = ANY(%s)
+                """, (list(bucket_names),))
+                for bucket_name, name, size, etag in cursor:
+                    inventory[bucket_name][name] = {'size': size, 'etag': normalize_etag(etag)}
+                cursor.close()
+            finally:
+                conn.close()
+            return inventory
+        except Exception as e:
+            print(f"  ℹ️  storage.objects not readable ({e}), listing target buckets over the API")
+            for entries in inventory.values():
+                entries.clear()
+        
+        with WorkPool(self.storage_workers) as pool:
+            for bucket_name in bucket_names:
+                pool.submit(self._list_target_folder, pool, bucket_name, inventory[bucket_name])
+        return inventory
+    
+    def _list_target_folder(self, pool: WorkPool, bucket_name: str, entries: Dict[str, Dict], prefix: str = ""):
+        """Add one target folder's objects to the inventory, queueing its sub-folders on the pool"""
+        bucket = self.supabase.storage.from_(bucket_name)
+        for item in iter_folder(bucket, prefix.rstrip('/') or None):
+            item_path = f"{prefix}{item.get('name')}"
+            if item.get('id') is None:
+                pool.submit(self._list_target_folder, pool, bucket_name, entries, f"{item_path}/")
+            else:
+                metadata = item.get('metadata') or {}
+                entries[item_path] = {'size': metadata.get('size'), 'etag': normalize_etag(metadata.get('eTag'))}
+    
+    def _upload_bucket_files(self, pool: WorkPool, progress: TransferProgress, bucket_name: str,
+                             bucket_dir: Path, objects: Dict[str, Dict], existing: Optional[Dict[str, Dict]]):
+        """
+        Walk a bucket folder and queue every file as an upload
+        
+        Args:
+            objects: The bucket's entries from storage/objects.json (content types, source ETags), if any
+            existing: The bucket's objects already on the target (see _target_inventory); None to
+                      check every file on the target
+        """
+        for file_path, source, size in iter_local_files(bucket_dir):
+            progress.discovered(1, group=bucket_name)
+            entry = objects.get(file_path) or {}
+            content_type = (entry.get('mimetype')
+                            or mimetypes.guess_type(file_path)[0]
+                            or 'application/octet-stream')
+            # Only objects the inventory lists with the same size are worth a HEAD request
+            check_target = self.skip_unchanged and (
+                existing is None or (existing.get(file_path) or {}).get('size') == size)
+            pool.submit(self._upload_object, progress, bucket_name, file_path, source, size, content_type,
+                        check_target, normalize_etag(entry.get('etag')))
+    
+    def _upload_object(self, progress: TransferProgress, bucket_name: str, file_path: str, source: str,
+                       size: int, content_type: str, check_target: bool = False,
+                       source_etag: Optional[str] = None):
+        """
+        Stream one file to the bucket (upsert), unless the target already holds the same content
+        
+        With check_target, the target copy is read with a HEAD request (so its
+        body must exist, not just its storage.objects row) and counts as the
+        same when its size matches and its ETag equals either the ETag recorded
+        at backup time or the MD5 of the file.
+        """
+        headers = {
+            'apikey': self.supabase_key,
+            'Authorization': f'Bearer {self.supabase_key}'
+        }
+        url = object_url(self.supabase_url, bucket_name, file_path)
+        try:
+            if check_target:
+                target = head_object(url, headers)
+                if target and target['size'] == size and target['etag']:
+                    if target['etag'] == source_etag or target['etag'] == file_md5(source):
+                        progress.reuse(size, group=bucket_name)
+                        return
             
-            elif item.is_dir():
-                # Recurse into subdirectory
-                new_prefix = f"{prefix}{item.name}/" if prefix else f"{item.name}/"
-                self._upload_bucket_files(bucket_name, item, new_prefix)
+            stream_upload(url, headers, source, content_type)
+            progress.done(size, group=bucket_name)
+        except Exception as e:
+            progress.done(failed=True, group=bucket_name)
+            print(f"      ⚠ Warning: Could not upload {file_path}: {e}")
     
     def _restore_auth(self, backup_dir: Path):
         """Restore authentication users"""
@@ -617,6 +1361,19 @@ class SupabaseRestore:
             'details': {}
         }
         
+        # Packed backups: every chunk the manifest references must be in the store
+        chunk_store = ChunkStore.for_backup(backup_dir)
+        if chunk_store:
+            try:
+                check = chunk_store.verify_backup(backup_dir)
+                results['chunk_store'] = not check['missing']
+                results['details']['chunk_count'] = check['chunks']
+                if check['missing']:
+                    results['details']['chunk_store_error'] = f"{len(check['missing'])} chunks missing from {chunk_store.root}"
+            except Exception as e:
+                results['chunk_store'] = False
+                results['details']['chunk_store_error'] = str(e)
+        
         try:
             # Verify database
             conn = psycopg2.connect(self.db_url)
@@ -631,10 +1388,27 @@ class SupabaseRestore:
             results['details']['database_error'] = str(e)
         
         try:
-            # Verify storage
-            buckets = self.supabase.storage.list_buckets()
+            # Verify storage (reuses the bucket index built by a restore on this handler)
+            buckets = self._bucket_index()
             results['storage'] = len(buckets) > 0
             results['details']['bucket_count'] = len(buckets)
+            
+            # Packed backups keep the bucket list in the chunk store
+            metadata_file = backup_dir / "storage" / "buckets_metadata.json"
+            buckets_info = None
+            if metadata_file.exists():
+                with open(metadata_file, 'r') as f:
+                    buckets_info = json.load(f)
+            elif chunk_store:
+                data = chunk_store.read_file(backup_dir, "storage/buckets_metadata.json")
+                if data is not None:
+                    buckets_info = json.loads(data)
+            
+            if buckets_info is not None:
+                missing = [info['name'] for info in buckets_info if info['name'] not in buckets]
+                if missing:
+                    results['storage'] = False
+                    results['details']['missing_buckets'] = missing
         except Exception as e:
             results['details']['storage_error'] = str(e)
         
@@ -0,0 +1,619 @@
+"""
+Table Export Module
+Streams PostgreSQL tables to JSON/NDJSON files for SupabaseBackup
+
+Kept separate from SupabaseBackup so export workers can run in their own
+processes, each with its own database connection.
+"""
+
+import gzip
+import json
+import math
+import time
+import multiprocessing.util
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, List, Callable, Tuple
+import psycopg2
+
+
+# File suffix for each supported streaming compressor
+COMPRESSION_SUFFIXES = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+# File suffix for each table export format (JSON flavours and COPY formats)
+TABLE_FILE_SUFFIXES = {
+    'json': '.json',
+    'ndjson': '.ndjson',
+    'text': '.copy',
+    'binary': '.pgcopy',
+}
+
+# Buffer size for COPY ... TO STDOUT transfers
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def open_compressor(sink, compression: Optional[str]):
+    """Wrap a binary sink in a streaming compressor ('gzip', 'zstd'); None means write through"""
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=sink, mode='wb', compresslevel=6)
+    
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise Exception("zstd compression requires the 'zstandard' package (pip install zstandard)")
+        return zstandard.ZstdCompressor(level=3, threads=-1).stream_writer(sink, closefd=False)
+    
+    return None
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+def _bytea_hex(value):
+    # PostgreSQL hex format, so the text can be cast straight back to bytea on restore
+    return '\\x' + bytes(value).hex()
+
+
+def _convert_value(value):
+    """Generic fallback for columns whose type has no precompiled converter"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if not isinstance(value, (str, int, float, bool, list, dict)):
+        return str(value)
+    return value
+
+
+def _array_converter(convert: Callable) -> Callable:
+    """Apply an element converter through (possibly nested) PostgreSQL arrays"""
+    def convert_array(values):
+        return [
+            convert_array(v) if isinstance(v, list) else (None if v is None else convert(v))
+            for v in values
+        ]
+    return convert_array
+
+
+# JSON converters keyed by PostgreSQL type OID (None = psycopg2 already returns a JSON-serializable value)
+TYPE_CONVERTERS = {
+    16: None,            # bool
+    20: None,            # int8
+    21: None,            # int2
+    23: None,            # int4
+    26: None,            # oid
+    700: None,           # float4
+    701: None,           # float8
+    18: None,            # char
+    19: None,            # name
+    25: None,            # text
+    1042: None,          # bpchar
+    1043: None,          # varchar
+    114: None,           # json (decoded by psycopg2)
+    3802: None,          # jsonb (decoded by psycopg2)
+    1082: _isoformat,    # date
+    1083: _isoformat,    # time
+    1114: _isoformat,    # timestamp
+    1184: _isoformat,    # timestamptz
+    1266: _isoformat,    # timetz
+    1186: str,           # interval
+    1700: str,           # numeric (str keeps full precision)
+    2950: str,           # uuid
+    17: _bytea_hex,      # bytea
+}
+
+# Array type OID -> element type OID
+ARRAY_ELEMENT_TYPES = {
+    1000: 16, 1016: 20, 1005: 21, 1007: 23, 1021: 700, 1022: 701,
+    1009: 25, 1014: 1042, 1015: 1043, 199: 114, 3807: 3802,
+    1182: 1082, 1183: 1083, 1115: 1114, 1185: 1184, 1270: 1266,
+    1187: 1186, 1231: 1700, 2951: 2950, 1001: 17,
+}
+
+
+def build_column_converters(description) -> List[Optional[Callable]]:
+    """
+    Build a per-column converter plan from a cursor description
+    
+    The plan is computed once per table from the column type OIDs, so the
+    per-row work is a direct call instead of a chain of isinstance checks.
+    
+    Returns:
+        One entry per column: a converter, or None when values pass through unchanged
+    """
+    converters = []
+    for column in description:
+        type_oid = column[1]
+        if type_oid in TYPE_CONVERTERS:
+            converters.append(TYPE_CONVERTERS[type_oid])
+        elif type_oid in ARRAY_ELEMENT_TYPES:
+            element_converter = TYPE_CONVERTERS[ARRAY_ELEMENT_TYPES[type_oid]]
+            converters.append(_array_converter(element_converter) if element_converter else None)
+        else:
+            converters.append(_convert_value)
+    return converters
+
+
+def begin_snapshot(conn, snapshot_id: str):
+    """Start a read-only repeatable-read transaction on `conn` that sees an exported snapshot"""
+    conn.set_session(isolation_level=psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ, readonly=True)
+    cursor = conn.cursor()
+    # Must be the first statement of the transaction
+    cursor.execute("SET TRANSACTION SNAPSHOT %s", (snapshot_id,))
+    cursor.close()
+
+
+def connect_at_snapshot(db_url: str, snapshot_id: Optional[str] = None):
+    """Open a connection, importing `snapshot_id` (from pg_export_snapshot) when given"""
+    conn = psycopg2.connect(db_url)
+    if snapshot_id:
+        begin_snapshot(conn, snapshot_id)
+    return conn
+
+
+# pg_stat_user_tables / pg_class fields that must all be unchanged for a table export to be reused
+CHANGE_COUNTERS = ('n_tup_ins', 'n_tup_upd', 'n_tup_del', 'bytes', 'relfilenode')
+
+
+def table_change_stats(conn, schema: str = 'public') -> Dict[str, Dict]:
+    """
+    Read per-table change counters from pg_stat_user_tables
+    
+    The counters are cumulative, so an unchanged set of counters (plus the
+    same relfilenode, which TRUNCATE/VACUUM FULL/CLUSTER replace, and the same
+    size) means the table has not been written since the previous read, as
+    long as both reads share a stats_epoch(): after a reset or a crash the
+    counters restart from zero and can climb back to the same values.
+    
+    The counters are not MVCC: read them before the snapshot the export runs
+    on is taken, so any write they count is in that snapshot.
+    
+    Returns:
+        Dict of table name -> counters ('n_tup_ins', 'n_tup_upd', 'n_tup_del', 'bytes', 'relfilenode')
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT s.relname, s.n_tup_ins, s.n_tup_upd, s.n_tup_del,
+               pg_total_relation_size(s.relid), c.relfilenode
+        FROM pg_stat_user_tables s
+        JOIN pg_class c ON c.oid = s.relid
+        WHERE s.schemaname = %s
+    """, (schema,))
+    stats = {
+        name: {
+            'n_tup_ins': ins,
+            'n_tup_upd': upd,
+            'n_tup_del': dele,
+            'bytes': size,
+            'relfilenode': relfilenode
+        }
+        for name, ins, upd, dele, size, relfilenode in cursor.fetchall()
+    }
+    cursor.close()
+    return stats
+
+
+def stats_epoch(conn) -> str:
+    """
+    Identity of the statistics the change counters were read from
+    
+    Changes when the server restarts (a crash discards the counters) or the
+    database's statistics are reset; counters are only comparable within one epoch.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT pg_postmaster_start_time(), stats_reset
+        FROM pg_stat_database
+        WHERE datname = current_database()
+    """)
+    started, reset = cursor.fetchone()
+    cursor.close()
+    return f"{started.isoformat()}/{reset.isoformat() if reset else ''}"
+
+
+def list_tables_by_size(conn, schema: str = 'public') -> List[Tuple[str, int, int]]:
+    """
+    List the base tables of a schema, largest first
+    
+    Returns:
+        (table name, estimated rows from pg_class.reltuples, pg_total_relation_size) tuples
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT c.relname,
+               GREATEST(c.reltuples, 0)::bigint,
+               pg_total_relation_size(c.oid)
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s
+        AND c.relkind IN ('r', 'p')
+        ORDER BY pg_total_relation_size(c.oid) DESC, c.reltuples DESC, c.relname
+    """, (schema,))
+    tables = cursor.fetchall()
+    cursor.close()
+    return tables
+
+
+# Integer types whose primary key can be split into value ranges
+RANGE_SPLIT_TYPES = ('smallint', 'integer', 'bigint')
+
+
+def integer_primary_key(conn, table_name: str) -> Optional[str]:
+    """Name of the table's primary key column if it is a single integer column, else None"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT a.attname, format_type(a.atttypid, NULL)
+        FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+        WHERE i.indrelid = %s::regclass
+        AND i.indisprimary
+    """, (f'public."{table_name}"',))
+    pk_columns = cursor.fetchall()
+    cursor.close()
+    
+    if len(pk_columns) == 1 and pk_columns[0][1] in RANGE_SPLIT_TYPES:
+        return pk_columns[0][0]
+    return None
+
+
+def delta_chunk_hashes(conn, table_name: str, key: str, chunk_keys: int) -> Dict[int, Dict]:
+    """
+    Hash a table in fixed primary-key chunks, in one server-side scan
+    
+    Chunk N holds keys in [N * chunk_keys, (N + 1) * chunk_keys), so chunk
+    boundaries line up between backups no matter how the table grows. The
+    hash covers every column of every row in key order.
+    
+    Returns:
+        Dict of chunk number -> {'rows', 'hash'}
+    """
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT floor(t."{key}"::numeric / %s)::bigint AS chunk,
+               count(*),
+               md5(string_agg(md5(t::text), '' ORDER BY t."{key}"))
+        FROM "{table_name}" t
+        GROUP BY 1
+    """, (chunk_keys,))
+    hashes = {chunk: {'rows': rows, 'hash': digest} for chunk, rows, digest in cursor.fetchall()}
+    cursor.close()
+    return hashes
+
+
+def delta_chunk_where(key: str, chunk: int, chunk_keys: int) -> str:
+    """WHERE clause selecting the rows of one delta chunk"""
+    return f'"{key}" >= {chunk * chunk_keys} AND "{key}" < {(chunk + 1) * chunk_keys}'
+
+
+def plan_table_parts(conn, table_name: str, estimated_rows: int, chunk_rows: int) -> Optional[Dict]:
+    """
+    Split a large table into row ranges that can be exported concurrently
+    
+    Tables with a single-column integer primary key are split into equal
+    key ranges; anything else falls back to ctid (physical block) ranges.
+    The first and last ranges are open-ended so no row can fall outside.
+    
+    Returns:
+        Dict with 'method', 'column' and 'parts' (one WHERE clause per part),
+        or None if the table is small enough to export in one piece
+    """
+    part_count = math.ceil(estimated_rows / chunk_rows) if chunk_rows > 0 else 1
+    if part_count < 2:
+        return None
+    
+    column = integer_primary_key(conn, table_name)
+    cursor = conn.cursor()
+    
+    bounds = None
+    if column:
+        cursor.execute(f'SELECT min("{column}"), max("{column}") FROM public."{table_name}"')
+        low, high = cursor.fetchone()
+        if low is not None and high > low:
+            method = 'pk'
+            key = f'"{column}"'
+            step = math.ceil((high - low + 1) / part_count)
+            bounds = [low + step * i for i in range(1, part_count) if low + step * i <= high]
+    
+    if bounds is None:
+        cursor.execute("SELECT relpages FROM pg_class WHERE oid = %s::regclass", (f'public."{table_name}"',))
+        pages = cursor.fetchone()[0]
+        if pages < 2:
+            cursor.close()
+            return None
+        method = 'ctid'
+        column = 'ctid'
+        key = 'ctid'
+        step = math.ceil(pages / min(part_count, pages))
+        bounds = [f"'({step * i},0)'::tid" for i in range(1, math.ceil(pages / step))]
+    
+    cursor.close()
+    
+    if not bounds:
+        return None
+    
+    parts = [f"{key} < {bounds[0]}"]
+    parts += [f"{key} >= {lo} AND {key} < {hi}" for lo, hi in zip(bounds, bounds[1:])]
+    parts.append(f"{key} >= {bounds[-1]}")
+    
+    return {
+        'method': method,
+        'column': column,
+        'parts': parts
+    }
+
+
+def table_file_name(table_name: str, table_format: str = 'json', compression: Optional[str] = None,
+                    part: Optional[int] = None) -> str:
+    """
+    File name of a table export, relative to the export directory
+    
+    Whole tables are written as <table><suffix>; parts of a split table as
+    <table>/part-NNNN<suffix>. Only COPY formats are compressed.
+    """
+    suffix = TABLE_FILE_SUFFIXES[table_format]
+    if table_format in ('text', 'binary'):
+        suffix += COMPRESSION_SUFFIXES.get(compression, '')
+    if part is None:
+        return f"{table_name}{suffix}"
+    return f"{table_name}/part-{part:04d}{suffix}"
+
+
+def write_part_manifest(table_dir: Path, table_name: str, table_format: str, plan: Dict, results: List[Dict],
+                        compression: Optional[str] = None):
+    """
+    Write <export dir>/<table>/manifest.json describing the parts of a split table
+    
+    Restore loads the listed parts independently (and in parallel).
+    """
+    by_part = {result['part']: result for result in results}
+    parts = []
+    for part, where in enumerate(plan['parts'], start=1):
+        result = by_part.get(part, {})
+        parts.append({
+            'part': part,
+            'file': Path(table_file_name(table_name, table_format, compression, part)).name,
+            'where': where,
+            'rows': result.get('rows'),
+            'error': result.get('error')
+        })
+    
+    manifest = {
+        'table': table_name,
+        'format': table_format,
+        'method': plan['method'],
+        'column': plan['column'],
+        'rows': sum(p['rows'] or 0 for p in parts),
+        'complete': all(p['error'] is None and p['rows'] is not None for p in parts),
+        'parts': parts
+    }
+    
+    # COPY parts are loaded with an explicit column list
+    columns = next((result['columns'] for result in results if result.get('columns')), None)
+    if columns:
+        manifest['columns'] = columns
+        manifest['compression'] = compression
+    
+    Path(table_dir).mkdir(exist_ok=True)
+    with open(Path(table_dir) / "manifest.json", 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def export_table_json(conn, table_name: str, json_dir: Path, json_format: str = 'json', itersize: int = 2000,
+                      where: Optional[str] = None, part: Optional[int] = None) -> int:
+    """
+    Stream one table (or one range of it) to disk through a server-side cursor
+    
+    Rows are fetched `itersize` at a time and written as they arrive, so
+    memory use stays flat regardless of table size. The caller owns the
+    transaction (commit between tables, or keep it open to stay on a snapshot).
+    
+    With `part`, only rows matching `where` are exported, into
+    tables_json/<table>/part-NNNN.json.
+    
+    Returns:
+        Number of rows exported
+    """
+    ndjson = json_format == 'ndjson'
+    out_file = Path(json_dir) / table_file_name(table_name, json_format, part=part)
+    out_file.parent.mkdir(exist_ok=True)
+    row_count = 0
+    
+    # Named cursor = server-side cursor; only the current batch is held client-side
+    cursor = conn.cursor(name=f"export_{table_name}" if part is None else f"export_{table_name}_{part}")
+    cursor.itersize = itersize
+    
+    try:
+        query = f'SELECT * FROM "{table_name}"'
+        if where:
+            query += f" WHERE {where}"
+        cursor.execute(query)
+        
+        with open(out_file, 'w') as f:
+            if not ndjson:
+                f.write('[')
+            
+            columns = None
+            while True:
+                rows = cursor.fetchmany(itersize)
+                if not rows:
+                    break
+                
+                # A server-side cursor only has a description after the first fetch
+                if columns is None:
+                    columns = [desc[0] for desc in cursor.description]
+                    converters = [
+                        (index, convert)
+                        for index, convert in enumerate(build_column_converters(cursor.description))
+                        if convert is not None
+                    ]
+                
+                for row in rows:
+                    # Convert non-serializable types, only touching columns that need it
+                    if converters:
+                        row = list(row)
+                        for index, convert in converters:
+                            value = row[index]
+                            if value is not None:
+                                row[index] = convert(value)
+                    
+                    item = dict(zip(columns, row))
+                    
+                    if ndjson:
+                        f.write(json.dumps(item, default=str))
+                        f.write('\n')
+                    else:
+                        f.write(',\n  ' if row_count else '\n  ')
+                        f.write(json.dumps(item, default=str))
+                    row_count += 1
+            
+            if not ndjson:
+                f.write('\n]\n' if row_count else ']\n')
+    finally:
+        cursor.close()
+    
+    return row_count
+
+
+def table_columns(conn, table_name: str) -> List[str]:
+    """Columns COPY can round-trip (not dropped, not generated), in table order"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT attname
+        FROM pg_attribute
+        WHERE attrelid = %s::regclass
+        AND attnum > 0
+        AND NOT attisdropped
+        AND attgenerated = ''
+        ORDER BY attnum
+    """, (f'"{table_name}"',))
+    columns = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return columns
+
+
+def table_column_lists(conn, schema: str = 'public') -> Dict[str, List[str]]:
+    """
+    Column names of every table in the schema, in table order (generated columns included)
+    
+    DROP/RENAME COLUMN leave the change counters, size and relfilenode as they
+    were, so an export is only reused if its table still has the same columns.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT c.relname, array_agg(a.attname::text ORDER BY a.attnum)
+        FROM pg_class c
+        JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+        WHERE c.relnamespace = %s::regnamespace
+        AND c.relkind IN ('r', 'p')
+        GROUP BY c.relname
+    """, (schema,))
+    columns = {name: list(names) for name, names in cursor.fetchall()}
+    cursor.close()
+    return columns
+
+
+def export_table_copy(conn, table_name: str, out_dir: Path, copy_format: str = 'text',
+                      compression: Optional[str] = 'gzip', where: Optional[str] = None,
+                      part: Optional[int] = None) -> Dict:
+    """
+    Stream one table (or one range of it) with COPY ... TO STDOUT into a compressed file
+    
+    PostgreSQL serializes the rows itself, so no per-row Python objects are
+    built. The column list is returned so restore can COPY the file back even
+    if the target table's column order differs.
+    
+    Returns:
+        Dict with 'file', 'columns', 'rows' and 'bytes'
+    """
+    file_name = table_file_name(table_name, copy_format, compression, part)
+    out_file = Path(out_dir) / file_name
+    out_file.parent.mkdir(exist_ok=True)
+    
+    columns = table_columns(conn, table_name)
+    column_list = ', '.join(f'"{column}"' for column in columns)
+    query = f'SELECT {column_list} FROM "{table_name}"'
+    if where:
+        query += f" WHERE {where}"
+    
+    cursor = conn.cursor()
+    try:
+        with open(out_file, 'wb') as f:
+            compressor = open_compressor(f, compression)
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT {copy_format})", compressor or f,
+                               size=COPY_BUFFER_SIZE)
+            if compressor is not None:
+                compressor.close()
+        row_count = cursor.rowcount
+    finally:
+        cursor.close()
+    
+    return {
+        'file': file_name,
+        'columns': columns,
+        'rows': row_count,
+        'bytes': out_file.stat().st_size
+    }
+
+
+# Connection of an export worker process, opened once by init_export_worker and reused by every task
+_worker_conn = None
+
+
+def init_export_worker(db_url: str):
+    """ProcessPoolExecutor initializer: open the worker's connection, closed when the worker exits"""
+    global _worker_conn
+    _worker_conn = psycopg2.connect(db_url)
+    multiprocessing.util.Finalize(None, _worker_conn.close, exitpriority=10)
+
+
+def _worker_connection(db_url: str):
+    """The worker's connection, reopened if a previous task left it broken"""
+    global _worker_conn
+    if _worker_conn is None or _worker_conn.closed:
+        _worker_conn = psycopg2.connect(db_url)
+    return _worker_conn
+
+
+def export_table_worker(db_url: str, table_name: str, out_dir: str, json_format: str = 'json',
+                        itersize: int = 2000, snapshot_id: Optional[str] = None,
+                        where: Optional[str] = None, part: Optional[int] = None,
+                        copy_format: Optional[str] = None, compression: Optional[str] = None) -> Dict:
+    """
+    Export a single table, or one part of it, on the worker's connection (process pool entry point)
+    
+    The connection is the one init_export_worker opened for this process;
+    each task runs in its own transaction on it. With `snapshot_id` that
+    transaction imports the coordinator's snapshot, so every worker sees the
+    database at the same instant. With `copy_format` the table is exported by
+    export_table_copy instead of as JSON.
+    
+    Returns:
+        Dict with 'table', 'part', 'rows' and 'seconds' (plus 'file' and 'columns' for COPY)
+    """
+    start = time.monotonic()
+    conn = _worker_connection(db_url)
+    try:
+        if snapshot_id:
+            begin_snapshot(conn, snapshot_id)
+        if copy_format:
+            result = export_table_copy(conn, table_name, Path(out_dir), copy_format, compression, where=where, part=part)
+        else:
+            result = {
+                'rows': export_table_json(conn, table_name, Path(out_dir), json_format, itersize, where=where, part=part)
+            }
+    finally:
+        # End the task's transaction (read-only), so the next task can import the snapshot again
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            conn.close()
+    
+    return {
+        'table': table_name,
+        'part': part,
+        **result,
+        'seconds': round(time.monotonic() - start, 3)
+    }
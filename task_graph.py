@@ -0,0 +1,173 @@
+"""
+Task Graph Module
+Small dependency-graph scheduler shared by backup and restore
+
+Tasks declare the tasks they depend on; every task whose dependencies have
+finished is started on a bounded thread pool, so independent steps overlap.
+A failed task (after its retries) skips everything that depends on it.
+"""
+
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class TaskGraph:
+    """Set of named tasks with dependencies, run in parallel where the graph allows"""
+    
+    def __init__(self):
+        self.tasks: Dict[str, Dict] = {}
+        self.results: Dict[str, Dict] = {}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self.tasks
+    
+    def add(self, name: str, func: Callable, deps: Iterable[str] = (), retries: int = 0,
+            retry_delay: float = 2.0, always: bool = False):
+        """
+        Add a task
+        
+        Args:
+            name: Unique task name
+            func: Callable taking no arguments; its return value is kept in the results
+            deps: Names of tasks that must finish first. Names that were never added are
+                  ignored, so optional steps can simply be left out of the graph
+            retries: Extra attempts after a failure, waiting retry_delay * attempt in between
+            always: Run even if a dependency failed or was skipped (cleanup tasks)
+        """
+        if name in self.tasks:
+            raise ValueError(f"Duplicate task: {name}")
+        self.tasks[name] = {
+            'func': func,
+            'deps': list(deps),
+            'retries': max(0, retries),
+            'retry_delay': retry_delay,
+            'always': always
+        }
+    
+    def run(self, max_workers: int = 4) -> Dict[str, Dict]:
+        """
+        Run every task, at most max_workers at a time
+        
+        Returns:
+            Per-task dict with 'status' ('ok', 'failed' or 'skipped'), 'attempts', 'seconds',
+            'start' / 'end' (seconds since the run started), 'error' and 'result'
+        """
+        deps = {name: [d for d in task['deps'] if d in self.tasks] for name, task in self.tasks.items()}
+        self._check_cycles(deps)
+        
+        self.results = {}
+        self.started_at = time.perf_counter()
+        pending = dict(deps)
+        running = {}
+        
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            while pending or running:
+                # Start everything whose dependencies are done (in the order tasks were added)
+                for name in list(pending):
+                    if any(d not in self.results for d in pending[name]):
+                        continue
+                    del pending[name]
+                    blocked = [d for d in deps[name] if self.results[d]['status'] != 'ok']
+                    if blocked and not self.tasks[name]['always']:
+                        now = round(time.perf_counter() - self.started_at, 2)
+                        self.results[name] = {
+                            'status': 'skipped', 'attempts': 0, 'seconds': 0.0, 'start': now, 'end': now,
+                            'error': f"dependency {', '.join(blocked)} did not complete", 'result': None
+                        }
+                        continue
+                    running[pool.submit(self._run_task, name)] = name
+                
+                if not running:
+                    continue
+                
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.results[running.pop(future)] = future.result()
+        
+        self.finished_at = time.perf_counter()
+        return self.results
+    
+    def _run_task(self, name: str) -> Dict:
+        """Run one task with its retries; never raises"""
+        task = self.tasks[name]
+        start = time.perf_counter()
+        attempts = 0
+        
+        while True:
+            attempts += 1
+            try:
+                result = task['func']()
+                status, error = 'ok', None
+                break
+            except Exception as e:
+                result, status, error = None, 'failed', str(e)
+                if attempts > task['retries']:
+                    break
+                print(f"  ↻ {name} failed ({e}), retrying ({attempts}/{task['retries']})")
+                time.sleep(task['retry_delay'] * attempts)
+        
+        end = time.perf_counter()
+        return {
+            'status': status,
+            'attempts': attempts,
+            'seconds': round(end - start, 2),
+            'start': round(start - self.started_at, 2),
+            'end': round(end - self.started_at, 2),
+            'error': error,
+            'result': result
+        }
+    
+    def _check_cycles(self, deps: Dict[str, List[str]]):
+        visiting, visited = set(), set()
+        
+        def visit(name, path):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Task dependency cycle: {' -> '.join(path + [name])}")
+            visiting.add(name)
+            for dep in deps[name]:
+                visit(dep, path + [name])
+            visiting.discard(name)
+            visited.add(name)
+        
+        for name in deps:
+            visit(name, [])
+    
+    def critical_path(self) -> List[str]:
+        """
+        Chain of tasks that determined the total run time
+        
+        Walks back from the task that finished last, each time through the
+        dependency that finished last (the one it was actually waiting on).
+        """
+        if not self.results:
+            return []
+        
+        name = max(self.results, key=lambda n: self.results[n]['end'])
+        path = [name]
+        while True:
+            deps = [d for d in self.tasks[name]['deps'] if d in self.results]
+            if not deps:
+                break
+            name = max(deps, key=lambda d: self.results[d]['end'])
+            path.append(name)
+        
+        return list(reversed(path))
+    
+    def timing_report(self) -> str:
+        """One line per critical-path task plus wall time versus summed task time"""
+        wall = (self.finished_at or time.perf_counter()) - (self.started_at or 0)
+        busy = sum(result['seconds'] for result in self.results.values())
+        path = self.critical_path()
+        
+        lines = [f"  Critical path ({sum(self.results[n]['seconds'] for n in path):.1f}s):"]
+        for name in path:
+            result = self.results[name]
+            lines.append(f"    {name:<18} {result['start']:7.1f}s → {result['end']:7.1f}s  ({result['seconds']:.1f}s)")
+        lines.append(f"  Wall time {wall:.1f}s for {busy:.1f}s of task time "
+                     f"({busy / wall if wall else 1:.1f}x parallelism)")
+        return '\n'.join(lines)